@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Plot-ready arrays of arrival times and batch rendering of charts.
+
+The arrival datetimes are read from the database as one column and converted to numpy arrays
+(numeric dates and hours) at once, instead of building a BSRegister for each row.
+"""
+
+import argparse
+import datetime as dt
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import input_interface
+from database import query_busstats
+from input_interface import DBConnection, normalize_lines
+from sources import DEFAULT_SOURCE
+
+# datetime64[m] of each arrival, matplotlib date number of its day and its time in hours.
+ArrivalArrays = namedtuple('ArrivalArrays', 'datetimes dates hours')
+
+logger = logging.getLogger(__name__)
+
+
+def to_arrays(datetimes):
+    """Converts a sequence of datetimes (or 'YYYY-MM-DD HH:MM:SS' strings) to ArrivalArrays."""
+    datetimes = np.array(datetimes, dtype='datetime64[m]')
+    days = datetimes.astype('datetime64[D]')
+    hours = (datetimes - days).astype('timedelta64[m]').astype(float) / 60
+    return ArrivalArrays(datetimes, mdates.date2num(days), hours)
+
+
+def load_arrivals(line, stop_id=833, start=None, end=None, time_window=None, grouped=True,
+                  path=None):
+    """Reads the arrival times of some lines in a bus stop.
+
+    Args:
+        line (str | int | Iterable): bus line or lines.
+        stop_id (int): bus stop identification. Default is 833, the hospital's stop.
+        start (datetime.date): first day to read. Default is the first day saved.
+        end (datetime.date): last day to read (included). Default is the last day saved.
+        time_window (Tuple[datetime.time, datetime.time]): if given, only the arrivals between
+            both times (included) are read.
+        grouped (bool): if True, the grouped arrivals are read (see
+            busdatagenerator.update_arrivals). Otherwise, every register with delay 0 is read,
+            including the months archived by retention.Retention when start or end is given.
+            In both cases, only the stops of the default source are read.
+        path (str): path of the database. Default is input_interface.DATABASE_PATH.
+
+    Returns:
+        ArrivalArrays: arrivals sorted by datetime.
+    """
+    lines = normalize_lines(line)
+
+    if grouped:
+        column = 'arrival_datetime'
+        query = f'select {column} from arrivals where '
+    else:
+        column = 'actual_datetime'
+        query = f'select {column} from {{schema}}.busstats where delay_minutes=0 and '
+
+    query += f'line in ({", ".join("?" * len(lines))}) and stop_id=?'
+    parameters = list(lines) + [int(stop_id)]
+    if not grouped:
+        query += ' and source=?'
+        parameters.append(DEFAULT_SOURCE)
+
+    if start is not None:
+        query += f' and {column} >= ?'
+        parameters.append(start.strftime('%Y-%m-%d'))
+    if end is not None:
+        query += f' and {column} < ?'
+        parameters.append((end + dt.timedelta(days=1)).strftime('%Y-%m-%d'))
+    if time_window is not None:
+        query += f' and substr({column}, 12) between ? and ?'
+        parameters += [x.strftime('%H:%M:%S') for x in time_window]
+
+    with DBConnection(path, readonly=True) as connection:
+        if grouped:
+            connection.cur.execute(query + f' order by {column}', parameters)
+            rows = connection.cur.fetchall()
+        else:
+            rows = query_busstats(connection.con, query, parameters, start, end, order_by=column)
+        datetimes = [x[0] for x in rows]
+
+    return to_arrays(datetimes)
+
+
+def daily_times(arrays):
+    """Splits the arrivals by day.
+
+    Args:
+        arrays (ArrivalArrays): arrivals sorted by datetime.
+
+    Returns:
+        List[Tuple[numpy.datetime64, numpy.ndarray]]: day and arrival datetimes of each day.
+    """
+    days = arrays.datetimes.astype('datetime64[D]')
+    unique, indexes = np.unique(days, return_index=True)
+    return list(zip(unique, np.split(arrays.datetimes, indexes[1:])))
+
+
+def plot_arrivals(ax, arrays, title=None):
+    """Scatters the arrival times (hours) against their dates.
+
+    Args:
+        ax (matplotlib.axes.Axes): axes to plot on.
+        arrays (ArrivalArrays): arrivals to plot.
+        title (str): title of the axes.
+    """
+    ax.scatter(arrays.dates, arrays.hours, marker='*', c='red')
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
+    ax.set_xlabel('Dates')
+    ax.set_ylabel('Arrival times')
+    if title:
+        ax.set_title(title)
+
+
+@dataclass(frozen=True)
+class ChartJob:
+    """Chart of the arrivals of some lines in a bus stop, to be rendered in batch."""
+    lines: Tuple[str, ...]
+    stop_id: int = 833
+    time_window: Optional[Tuple[dt.time, dt.time]] = None
+    start: Optional[dt.date] = None
+    end: Optional[dt.date] = None
+    grouped: bool = True
+
+    @property
+    def filename(self):
+        filename = f'stop-{self.stop_id}-line-{"-".join(self.lines)}'
+        if self.time_window is not None:
+            filename += '-' + '-'.join(x.strftime('%H%M') for x in self.time_window)
+        if self.start is not None:
+            filename += f'-from-{self.start:%Y%m%d}'
+        if self.end is not None:
+            filename += f'-to-{self.end:%Y%m%d}'
+        if not self.grouped:
+            filename += '-raw'
+        return filename + '.png'
+
+    @property
+    def title(self):
+        title = f'Arrival times in stop {self.stop_id} (line {", ".join(self.lines)})'
+        if self.time_window is not None:
+            title += ' ' + ' - '.join(x.strftime('%H:%M') for x in self.time_window)
+        return title
+
+
+def render_chart(job, folder, path=None, dpi=100):
+    """Renders a chart to a png file, without any gui backend.
+
+    Args:
+        job (ChartJob): chart to render.
+        folder (str): folder where the png file is saved.
+        path (str): path of the database.
+        dpi (int): resolution of the png file.
+
+    Returns:
+        str: path of the png file.
+    """
+    arrays = load_arrivals(job.lines, job.stop_id, job.start, job.end, job.time_window,
+                           job.grouped, path)
+
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    plot_arrivals(ax, arrays, job.title)
+    figure.autofmt_xdate()
+
+    output = os.path.join(folder, job.filename)
+    figure.savefig(output, dpi=dpi)
+    logger.debug('Rendered %d arrivals to %r', len(arrays.hours), output)
+    return output
+
+
+def render_charts(jobs, folder, path=None, workers=None, dpi=100):
+    """Renders several charts in parallel, each one in a worker process.
+
+    Args:
+        jobs (Iterable[ChartJob]): charts to render.
+        folder (str): folder where the png files are saved. It is created if it does not exist.
+        path (str): path of the database. Default is input_interface.DATABASE_PATH.
+        workers (int): number of processes. If it is 1, the charts are rendered in this process.
+            Default is the number of cpus.
+        dpi (int): resolution of the png files.
+
+    Returns:
+        List[str]: paths of the png files, in the same order as jobs.
+    """
+    jobs = list(jobs)
+    path = path or input_interface.DATABASE_PATH
+    os.makedirs(folder, exist_ok=True)
+
+    if workers == 1 or len(jobs) < 2:
+        return [render_chart(job, folder, path, dpi) for job in jobs]
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(render_chart, job, folder, path, dpi) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def _parse_time(value):
+    return dt.datetime.strptime(value, '%H:%M').time()
+
+
+def _parse_date(value):
+    return dt.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='BusStatsCharts')
+    parser.add_argument('-lines', nargs='+', default=['2', '8'],
+                        help='lines of each chart, separated by commas (2,8 is one chart)')
+    parser.add_argument('-stops', nargs='+', type=int, default=[833])
+    parser.add_argument('-window', nargs=2, action='append', type=_parse_time,
+                        metavar=('START', 'END'), help='time window (HH:MM), can be repeated')
+    parser.add_argument('-from', dest='start', type=_parse_date, help='first day (YYYY-MM-DD)')
+    parser.add_argument('-to', dest='end', type=_parse_date, help='last day (YYYY-MM-DD)')
+    parser.add_argument('-raw', action='store_true', help='use every register with delay 0 '
+                                                          'instead of the grouped arrivals')
+    parser.add_argument('-output', default='charts', help='folder of the png files')
+    parser.add_argument('-workers', type=int)
+    parser.add_argument('-database', help='path of the database')
+    opt = parser.parse_args()
+
+    windows = [tuple(x) for x in opt.window] if opt.window else [None]
+    jobs = [ChartJob(tuple(lines.split(',')), stop_id, window, opt.start, opt.end, not opt.raw)
+            for lines in opt.lines for stop_id in opt.stops for window in windows]
+
+    for output in render_charts(jobs, opt.output, opt.database, opt.workers):
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
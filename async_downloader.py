@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Asyncio downloader with the same retries control as Downloader."""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+
+import aiohttp
+
+from downloader import DownloaderError
+from metrics import METRICS
+
+
+@dataclass
+class AsyncResponse:
+    """Response of an AsyncDownloader request, already read."""
+    url: str
+    status_code: int
+    headers: dict
+    content: bytes
+    encoding: str = 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+
+class AsyncDownloader:
+    """Asyncio downloader with retries control.
+
+    A single session (and its connection pool) is shared by every request made inside the
+    context, so lots of requests can run concurrently in one thread. Concurrent GET requests of
+    the same url share one in-flight response, and if a rate limiter is given, every attempt
+    (retries included) waits for a token of the host.
+
+    Args:
+        retries (int): number of attempts of each request.
+        silenced (bool): if True, the logger has no handlers.
+        limit (int): maximum number of simultaneous connections.
+        limit_per_host (int): maximum number of simultaneous connections with each host.
+        rate_limiter (HostRateLimiter): rate limiter of the requests.
+    """
+
+    def __init__(self, retries=10, silenced=False, limit=10, limit_per_host=4,
+                 rate_limiter=None):
+        self.logger = logging.getLogger(__name__)
+
+        if silenced is True:
+            self.logger.handlers = []
+
+        self._retries = retries
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._rate_limiter = rate_limiter
+        self._session = None
+        self._in_flight = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host)
+        self._session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._session.close()
+        self._session = None
+
+    async def request(self, method, url, **kwargs):
+        self.logger.debug('%s %r', method, url)
+        retries = self._retries
+
+        while retries > 0:
+            if self._rate_limiter is not None and await self._rate_limiter.acquire_async(url):
+                METRICS.increment('throttled_requests')
+            try:
+                async with self._session.request(method, url, **kwargs) as response:
+                    return AsyncResponse(str(response.url), response.status,
+                                         dict(response.headers), await response.read(),
+                                         response.get_encoding())
+            except aiohttp.ClientConnectionError:
+                retries -= 1
+                self.logger.warning('Connection error in %s, retries=%s', method, retries)
+                METRICS.increment('download_retries')
+
+        self.logger.critical('Download error in %s %r', method, url)
+        raise DownloaderError('max retries failed.')
+
+    async def get(self, url, **kwargs):
+        if kwargs:
+            return await self.request('GET', url, **kwargs)
+
+        task = self._in_flight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self.request('GET', url))
+            self._in_flight[url] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(url, None))
+        else:
+            self.logger.debug('GET %r coalesced with an in-flight request', url)
+            METRICS.increment('coalesced_requests')
+
+        return await asyncio.shield(task)
+
+    async def post(self, url, data=None, json=None, **kwargs):
+        return await self.request('POST', url, data=data, json=json, **kwargs)
+
+    async def put(self, url, data=None, json=None, **kwargs):
+        return await self.request('PUT', url, data=data, json=json, **kwargs)
+
+    async def delete(self, url, data=None, json=None, **kwargs):
+        return await self.request('DELETE', url, data=data, json=json, **kwargs)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+"""Atomic replacement of the state and cache files shared between processes."""
+
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8'):
+    """Opens a temporary file that replaces path when the context ends without errors.
+
+    Readers of path (like other processes) never see a partially written file. If an exception
+    is raised inside the context, the temporary file is deleted and path is not modified.
+
+    Args:
+        path (str): path of the file to write.
+        mode (str): 'w' for text files or 'wb' for binary files.
+        encoding (str): encoding of text files.
+
+    Yields:
+        file object of the temporary file.
+    """
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, mode, encoding=None if 'b' in mode else encoding) as fh:
+            yield fh
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""Authentication of the requests made to the rest server."""
+
+import hashlib
+import hmac
+import os
+import platform
+import re
+import secrets
+import time
+from collections import defaultdict, deque
+from datetime import date
+
+if platform.system() == 'Linux':
+    SECRET_PATH = '/home/pi/busstats/busstats.key'
+else:
+    SECRET_PATH = 'D:/.scripts/busstats/busstats.key'
+
+SECRET_ENV = 'BUSSTATS_SECRET'
+TOKEN_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})\.([0-9a-f]{64})')
+TOKEN_LENGTH = 75
+
+
+class SecretNotFoundError(Exception):
+    """The shared secret is not configured."""
+
+
+def get_secret(create=False):
+    """Returns the secret shared between the server and the clients.
+
+    It is read from the environment variable BUSSTATS_SECRET or, if it is not set, from the
+    file SECRET_PATH. Only the server may create the secret: the clients must use the same one.
+
+    Args:
+        create (bool): if True and the secret is not found, a new secret is generated and saved
+            in SECRET_PATH, readable only by its owner.
+
+    Returns:
+        bytes: the secret.
+
+    Raises:
+        SecretNotFoundError: if the secret is not found and create is False.
+    """
+    secret = os.environ.get(SECRET_ENV)
+    if secret:
+        return secret.encode()
+
+    try:
+        with open(SECRET_PATH, 'rb') as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        if not create:
+            raise SecretNotFoundError(
+                f'Secret not found: set {SECRET_ENV} or copy the key file of the server to '
+                f'{SECRET_PATH!r}') from None
+
+    secret = secrets.token_hex(32).encode()
+    fd = os.open(SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(secret)
+    return secret
+
+
+def _sign(secret, day):
+    return hmac.new(secret, day.encode(), hashlib.sha256).hexdigest()
+
+
+def create_token(secret=None, day=None):
+    """Creates the token valid for a day.
+
+    Args:
+        secret (bytes): shared secret. If it is None, get_secret() is used, so the secret must
+            already exist.
+        day (datetime.date): day of validity of the token. Default is today.
+
+    Returns:
+        str: token with the format 'YYYY-MM-DD.<hmac-sha256 hexdigest>'.
+    """
+    secret = secret or get_secret()
+    day = (day or date.today()).isoformat()
+    return f'{day}.{_sign(secret, day)}'
+
+
+class TokenVerifier:
+    """Verifies tokens created with create_token.
+
+    Tokens already verified are cached for the rest of the day and clients that fail too many
+    times are blocked without checking their tokens.
+
+    Args:
+        secret (bytes): shared secret. If it is None, get_secret(create=True) is used, as the
+            verifier runs in the server.
+        max_failures (int): number of failures allowed for a client in the window.
+        window (int | float): length of the window in seconds.
+    """
+
+    def __init__(self, secret=None, max_failures=5, window=300):
+        self._secret = secret
+        self.max_failures = max_failures
+        self.window = window
+
+        self._day = None
+        self._verified = set()
+        self._failures = defaultdict(deque)
+
+    @property
+    def secret(self):
+        if self._secret is None:
+            self._secret = get_secret(create=True)
+        return self._secret
+
+    def is_blocked(self, client):
+        """Returns True if the client has failed too many times in the last window."""
+        failures = self._failures.get(client)
+        if not failures:
+            return False
+
+        limit = time.monotonic() - self.window
+        while failures and failures[0] < limit:
+            failures.popleft()
+
+        if not failures:
+            del self._failures[client]
+            return False
+        return len(failures) >= self.max_failures
+
+    def _prune(self, now):
+        # Forgets the clients without failures in the last window, so the clients that fail
+        # once and never come back do not stay in memory.
+        limit = now - self.window
+        for client in [x for x, failures in self._failures.items() if failures[-1] < limit]:
+            del self._failures[client]
+
+    def verify(self, token, client=None):
+        """Checks if a token is valid today.
+
+        Args:
+            token (str): token to verify.
+            client (str): identifier of the client, used to limit the failed attempts.
+
+        Returns:
+            bool: True if the token is valid, False otherwise.
+        """
+        today = date.today().isoformat()
+        if today != self._day:
+            self._day = today
+            self._verified.clear()
+
+        if token in self._verified:
+            return True
+
+        if self._check(token, today):
+            self._verified.add(token)
+            self._failures.pop(client, None)
+            return True
+
+        now = time.monotonic()
+        self._prune(now)
+        self._failures[client].append(now)
+        return False
+
+    def _check(self, token, today):
+        if not isinstance(token, str) or len(token) != TOKEN_LENGTH:
+            return False
+
+        match = TOKEN_PATTERN.fullmatch(token)
+        if match is None or match.group(1) != today:
+            return False
+
+        return hmac.compare_digest(match.group(2), _sign(self.secret, today))
@@ -0,0 +1,299 @@
+#!/usr/bin/python
+
+"""Offline benchmarks of the hot paths of busstats.
+
+Uses synthetic registers and the html fixtures saved in the fixtures folder, so no connection
+with auvasa.es is needed. The results are saved as json to compare them between commits.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+
+import requests
+
+import busdatagenerator
+import input_interface
+import rest_server
+from analysis import load_arrivals
+from busdatagenerator import DataBase, Register, load_registers, save_registers
+from connection_pool import POOL
+from data_mangement import DataManager
+from input_interface import DBConnection
+from sources import parse_stop_page
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+STOPS = ((686, ('2',)), (682, ('8',)), (812, ('2', '8')), (833, ('2', '8')), (880, ('2',)),
+         (1191, ('8',)), (1358, ('8',)))
+
+
+def synthetic_registers(n, seed=0, start=datetime(2019, 2, 4, 7, 0)):
+    """Generates registers similar to the ones saved by the generator.
+
+    Every minute each line of each stop is registered, with a delay that goes down from a random
+    headway to 0, as if a bus was getting closer to the stop.
+
+    Args:
+        n (int): number of registers.
+        seed (int): seed of the random generator.
+        start (datetime.datetime): datetime of the first register.
+
+    Returns:
+        List[Register]
+    """
+    rng = random.Random(seed)
+    delays = {(stop, line): rng.randint(5, 15) for stop, lines in STOPS for line in lines}
+
+    output = []
+    minute = 0
+    while len(output) < n:
+        actual_datetime = (start + timedelta(minutes=minute)).strftime('%Y-%m-%d %H:%M:%S')
+        for (stop, line), delay in delays.items():
+            output.append(Register(line, actual_datetime, delay, stop))
+            delays[(stop, line)] = delay - 1 if delay > 0 else rng.randint(5, 15)
+        minute += 1
+
+    return output[:n]
+
+
+def measure(function, repeat=5, items=None, setup=None):
+    """Runs a function several times and returns its timing statistics.
+
+    Args:
+        function (Callable): function to measure. If setup is given, it receives its result.
+        repeat (int): number of runs.
+        items (int): number of items processed in each run, to compute the throughput.
+        setup (Callable): function executed before each run, not measured.
+
+    Returns:
+        dict: min, median and mean time in seconds and, if items is set, items per second.
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        t0 = time.perf_counter()
+        function(argument) if setup else function()
+        times.append(time.perf_counter() - t0)
+
+    result = {'repeat': repeat, 'min': min(times), 'median': statistics.median(times),
+              'mean': statistics.mean(times)}
+    if items:
+        result['items'] = items
+        result['items_per_second'] = items / result['min']
+    return result
+
+
+@contextmanager
+def patched(module, **attributes):
+    """Temporarily replaces attributes of a module (paths and platform flags)."""
+    old = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(module, name, value)
+
+
+def create_database(path, registers):
+    with patched(busdatagenerator, LINUX=False, DATABASE_PATH=path):
+        database = DataBase()
+        database.use(path)
+        database.insert_multiple_registers(registers)
+        POOL.discard(path)
+
+
+def bench_parse(repeat):
+    with open(os.path.join(FIXTURES_PATH, 'parada_833.html'), 'rb') as fh:
+        content = fh.read()
+
+    def function():
+        for _ in range(100):
+            parse_stop_page(content, 833)
+
+    return measure(function, repeat, items=100)
+
+
+def bench_csv(folder, registers, repeat):
+    path = os.path.join(folder, 'busstats.csv')
+
+    with patched(busdatagenerator, CSV_PATH=path, LINUX=False), redirect_stdout(io.StringIO()):
+        save = measure(lambda: save_registers(registers), repeat, items=len(registers))
+        load = measure(load_registers, repeat, items=len(registers))
+
+    return {'save_registers': save, 'load_registers': load}
+
+
+def bench_insert(folder, registers, repeat, bulk=False):
+    path = os.path.join(folder, 'insert.sqlite')
+
+    def setup():
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(path + suffix):
+                os.remove(path + suffix)
+        database = DataBase()
+        database.use(path)
+        return database
+
+    def function(database):
+        if bulk:
+            with database.bulk_load():
+                database.insert_multiple_registers(registers)
+        else:
+            database.insert_multiple_registers(registers)
+        POOL.discard(path)
+
+    with patched(busdatagenerator, LINUX=False, DATABASE_PATH=path):
+        return measure(function, repeat, items=len(registers), setup=setup)
+
+
+def bench_analysis(path, repeat):
+    def get_data():
+        with DBConnection(path) as connection:
+            return connection.get_data(2)
+
+    def get_data_lines():
+        with DBConnection(path) as connection:
+            return connection.get_data((2, 8))
+
+    def get_data_readonly():
+        with DBConnection(path, readonly=True) as connection:
+            return connection.get_data(2)
+
+    number = len(get_data())
+    result = {'get_data': measure(get_data, repeat, items=number),
+              'get_data.readonly': measure(get_data_readonly, repeat, items=number),
+              'get_data.lines': measure(get_data_lines, repeat, items=len(get_data_lines())),
+              'load_arrivals': measure(lambda: load_arrivals(2, path=path, grouped=False), repeat,
+                                       items=number)}
+
+    with patched(input_interface, DATABASE_PATH=path):
+        def setup():
+            return DataManager(2)
+
+        result['group'] = measure(lambda dm: dm.group(), repeat, items=number, setup=setup)
+
+    return result
+
+
+def bench_server(folder, registers, repeat, requests_number=200):
+    path = os.path.join(folder, 'server.csv')
+
+    with patched(busdatagenerator, CSV_PATH=path):
+        save_registers(registers)
+
+    with patched(rest_server, SOURCE_CSV=path):
+        server = rest_server.get_server('127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/'
+
+        def function():
+            with requests.Session() as session:
+                for _ in range(requests_number):
+                    session.get(url).raise_for_status()
+
+        try:
+            result = measure(function, repeat, items=requests_number)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    result['bytes_per_request'] = os.path.getsize(path)
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=FIXTURES_PATH,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(size=20000, repeat=5, seed=0):
+    """Runs every benchmark and returns the results."""
+    registers = synthetic_registers(size, seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as folder:
+        results['analyse_stop.parse'] = bench_parse(repeat)
+        print('analyse_stop.parse done')
+
+        for name, result in bench_csv(folder, registers, repeat).items():
+            results[f'csv.{name}'] = result
+        print('csv done')
+
+        results['database.insert_multiple_registers'] = bench_insert(folder, registers, repeat)
+        results['database.insert_multiple_registers.bulk'] = bench_insert(
+            folder, registers, repeat, bulk=True)
+        print('database done')
+
+        path = os.path.join(folder, 'analysis.sqlite')
+        create_database(path, registers)
+        for name, result in bench_analysis(path, repeat).items():
+            results[f'analysis.{name}'] = result
+        print('analysis done')
+
+        results['rest_server.get'] = bench_server(folder, registers, repeat)
+        print('rest_server done')
+
+    return {
+        'commit': get_commit(),
+        'timestamp': datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'size': size,
+        'seed': seed,
+        'results': results
+    }
+
+
+def compare(old, new):
+    """Prints the speedup of every benchmark of new over old."""
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            print(f'{name:40} (new)')
+            continue
+        ratio = old['results'][name]['min'] / result['min']
+        print(f'{name:40} {result["min"]:10.4f} s  x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='BusStatsBenchmark')
+    parser.add_argument('-output', default='benchmark.json', help='json file to save results')
+    parser.add_argument('-compare', help='json file with previous results')
+    parser.add_argument('-size', type=int, default=20000, help='number of synthetic registers')
+    parser.add_argument('-repeat', type=int, default=5)
+    parser.add_argument('-seed', type=int, default=0)
+
+    opt = parser.parse_args()
+
+    data = run_benchmarks(opt.size, opt.repeat, opt.seed)
+
+    with open(opt.output, 'w', encoding='utf-8') as fh:
+        json.dump(data, fh, indent=4)
+    print(f'Results saved in {opt.output!r}')
+
+    if opt.compare:
+        with open(opt.compare, 'r', encoding='utf-8') as fh:
+            compare(json.load(fh), data)
+    else:
+        for name, result in data['results'].items():
+            print(f'{name:40} {result["min"]:10.4f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,41 +2,64 @@
 
 """Bus stats analyser. Made for getting bus timeouts stats."""
 import argparse
-import hashlib
+import asyncio
 import logging
 import os
 import platform
 import re
-import sqlite3
 import sys
 import time
 import traceback
+from contextlib import contextmanager
 from csv import DictReader, DictWriter
-from dataclasses import dataclass
-from datetime import datetime
 from typing import Iterable
 
-from bs4 import BeautifulSoup as Soup
 from rpi.connections import Connections
 from rpi.custom_logging import configure_logging
-from rpi.encryption import encrypt
 from rpi.filesize import size
 
+from async_downloader import AsyncDownloader
+from auth import create_token
+from connection_pool import POOL
+from database import DATABASE_PATH, GROUPER_STATE_PATH, STATS_CACHE_PATH, bulk_load, \
+    create_schema, query_busstats
+from delay_stats import DelayStats
 from downloader import Downloader
+from input_interface import BSRegister, normalize_lines
+from metrics import METRICS
+from online_grouping import OnlineGrouper
+from profiling import MODES, profile
+from rate_limit import LIMITER
+from retention import Retention
+from snapshot_cache import SnapshotCache
+from sources import DEFAULT_SOURCE, Register, get_source
+from watchlist import Scheduler, Watchlist, merge_entries
 
 if platform.system() == 'Linux':
     LINUX = True
-    DATABASE_PATH = None
     CSV_PATH = '/home/pi/busstats/busstats.csv'
-    configure_logging(filename='/home/pi/busstats/busstats.log')
+    SNAPSHOT_PATH = '/home/pi/busstats/snapshots.json'
+    WATCHLIST_PATH = '/home/pi/busstats/watchlist.json'
+    SCHEDULE_PATH = '/home/pi/busstats/schedule.json'
+    LOG_PATH = '/home/pi/busstats/busstats.log'
+    configure_logging(filename=LOG_PATH)
 
 else:
     LINUX = False
-    DATABASE_PATH = 'D:/.database/sql/busstats.sqlite'
     CSV_PATH = 'D:/Sistema/Downloads/busstats.csv'
-    configure_logging(name='busstats', filename='D:/.scripts/busstats/busstats.log')
+    SNAPSHOT_PATH = 'D:/.scripts/busstats/snapshots.json'
+    WATCHLIST_PATH = 'D:/.scripts/busstats/watchlist.json'
+    SCHEDULE_PATH = 'D:/.scripts/busstats/schedule.json'
+    LOG_PATH = 'D:/.scripts/busstats/busstats.log'
+    configure_logging(name='busstats', filename=LOG_PATH)
 
 SERVER_ADDRESS = 'http://sralloza.sytes.net:5415'
+BULK_LOAD_THRESHOLD = 50000
+CSV_FIELDNAMES = ('line', 'actual_datetime', 'delay_minutes', 'stop_id', 'source')
+SNAPSHOTS = SnapshotCache(SNAPSHOT_PATH)
+SNAPSHOT_MAX_AGE = 30
+WATCHLIST = Watchlist(WATCHLIST_PATH)
+SCHEDULER = Scheduler(WATCHLIST, SCHEDULE_PATH)
 
 
 class InvalidPlatformError(Exception):
@@ -44,7 +67,7 @@ class InvalidPlatformError(Exception):
 
 
 class DataBase:
-    """Manages the connection with the database"""
+    """Manages the connection with the database, taken from the shared connection pool."""
 
     def __init__(self):
 
@@ -60,79 +83,77 @@ class DataBase:
             return
         if database_path is None:
             database_path = DATABASE_PATH
-        self.con = sqlite3.connect(database_path)
+        self.con = POOL.get(database_path)
 
         self.cur = self.con.cursor()
-        self.cur.execute("""create table if not exists busstats (
-        id varchar primary key,
-        line varchar not null,
-        actual_datetime varchar not null,
-        delay_minutes integer not null,
-        stop_id integer not null)""")
-
-    def insert_multiple_registers(self, data):
+        create_schema(self.con)
+
+    @contextmanager
+    def bulk_load(self):
+        """Configures the database for inserting lots of registers (see database.bulk_load).
+
+        Everything imported is on disk when the context ends, so the csv file can be deleted.
+        """
+        self.use()
+        with bulk_load(self.con):
+            yield self
+
+    def insert_multiple_registers(self, data, ids=None):
         """Saves multiple registers at once to the database.
 
         Args:
             data (Iterable[Register]): iterable containing registers to save to database.
+            ids (Set[str]): IDs already saved in the database, if they are known.
         """
         values = []
-        ids = self.get_ids()
 
-        for element in data:
-            if element.id not in ids:
-                values.append((element.id, element.line, element.actual_datetime,
-                               element.delay_minutes, element.stop_id))
+        with METRICS.timer('dedup'):
+            ids = set(self.get_ids() if ids is None else ids)
+
+            for element in data:
+                if element.id not in ids:
+                    ids.add(element.id)
+                    values.append((element.id, element.line, element.actual_datetime,
+                                   element.delay_minutes, element.stop_id, element.source))
 
-        values = tuple(values)
+            values = tuple(values)
 
-        self.cur.executemany("insert into busstats values(?,?,?,?,?)", values)
+        with METRICS.timer('insert'):
+            self.cur.executemany("insert into busstats values(?,?,?,?,?,?)", values)
+            self.con.commit()
+
+        METRICS.increment('inserted_registers', len(values))
+        return len(values)
+
+    def insert_arrivals(self, arrivals):
+        """Saves grouped arrivals to the database.
+
+        Args:
+            arrivals (Iterable[Tuple[BSRegister, int]]): pairs of register and stop id.
+        """
+        values = [(register.line, stop_id, register._datetime.strftime('%Y-%m-%d %H:%M:%S'))
+                  for register, stop_id in arrivals]
+
+        self.cur.executemany('insert or ignore into arrivals values(?,?,?)', values)
         self.con.commit()
         return len(values)
 
-    @staticmethod
-    def get_ids():
-        """Returns a tuple with all the register's IDs saved in the database."""
-        self = DataBase.__new__(DataBase)
-        self.__init__()
+    def get_ids(self):
+        """Returns a set with all the register's IDs saved in the database."""
         self.use()
 
         self.cur.execute('select id from busstats')
-        registers = [x[0] for x in self.cur.fetchall()]
-        return tuple(registers)
+        return {x[0] for x in self.cur}
 
 
 DB = DataBase()
 
 
 def get_length_database():
-    """Returns the number of registers saved in the database."""
+    """Returns the number of registers saved in the database, including the archived ones."""
     DB.use()
-    DB.cur.execute("select count(id) from busstats")
-    total = DB.cur.fetchone()[0]
-
-    return total
-
-
-@dataclass
-class Register:
-    """Represents a Bus Stat Register"""
-    line: str
-    actual_datetime: str
-    delay_minutes: int
-    stop_id: int
-
-    def __post_init__(self):
-        self.line = str(self.line)
-        self.actual_datetime = str(self.actual_datetime)
-        self.delay_minutes = int(self.delay_minutes)
-        self.stop_id = int(self.stop_id)
-
-    @property
-    def id(self):
-        """Returns the id of a register made with sha1"""
-        p = (self.line, self.actual_datetime, self.stop_id)
-        return hashlib.sha1(str(p).encode()).hexdigest()
+    rows = query_busstats(DB.con, 'select count(id) from {schema}.busstats', archived=True)
+    return sum(x[0] for x in rows)
 
 
 def load_registers() -> list:
@@ -140,99 +161,177 @@ def load_registers() -> list:
     try:
         if not LINUX:
             with open(CSV_PATH, 'r', encoding='utf-8') as csv_file:
-                number_of_lines = len(csv_file.read().splitlines()) - 2
+                number_of_lines = len(csv_file.read().splitlines()) - 1
             print(f'Preliminar scan found {number_of_lines} new registers')
 
-        with open(CSV_PATH, 'r', encoding='utf-8') as csv_file:
+        with open(CSV_PATH, 'r', encoding='utf-8') as csv_file, METRICS.timer('load'):
             csv_reader = DictReader(csv_file)
-            next(csv_reader)
 
             output = []
             for row in csv_reader:
                 output.append(Register(**row))
-            return output
+
+        METRICS.increment('loaded_registers', len(output))
+        return output
     except FileNotFoundError:
         if LINUX is False:
             print(f'File not found: {CSV_PATH!r}')
         return []
-    except StopIteration:
-        return []
 
 
 def save_registers(registers):
-    """Saves the registers to the csv file."""
-    with open(CSV_PATH, 'w', encoding='utf-8') as csv_file:
-        fieldnames = ['line', 'actual_datetime', 'delay_minutes', 'stop_id']
-        csv_writer = DictWriter(csv_file, fieldnames, quotechar='|', lineterminator='\n')
+    """Saves the registers to the csv file, replacing its content."""
+    with open(CSV_PATH, 'w', encoding='utf-8') as csv_file, METRICS.timer('write'):
+        csv_writer = DictWriter(csv_file, CSV_FIELDNAMES, quotechar='|', lineterminator='\n')
 
         csv_writer.writeheader()
 
         csv_writer.writerows([vars(register) for register in registers])
 
+    METRICS.increment('written_registers', len(registers))
+
+
+def append_registers(registers):
+    """Appends the registers to the csv file, so readers like register_index.RegisterIndex only
+    parse the new rows.
+
+    The header is written if the file is new. A file written with other columns is rewritten.
+    """
+    try:
+        with open(CSV_PATH, 'r', encoding='utf-8') as csv_file:
+            header = csv_file.readline().rstrip('\n')
+    except FileNotFoundError:
+        header = ''
+
+    if header and header != ','.join(CSV_FIELDNAMES):
+        save_registers(load_registers() + list(registers))
+        return
+
+    with open(CSV_PATH, 'a', encoding='utf-8') as csv_file, METRICS.timer('write'):
+        csv_writer = DictWriter(csv_file, CSV_FIELDNAMES, quotechar='|', lineterminator='\n')
+
+        if not header:
+            csv_writer.writeheader()
+
+        csv_writer.writerows([vars(register) for register in registers])
+
+    METRICS.increment('written_registers', len(registers))
+
+
+async def fetch_stop(stop_number: int, downloader: AsyncDownloader, source=DEFAULT_SOURCE):
+    """Downloads the data of every line of a bus stop and publishes it in the snapshot cache.
+
+    Args:
+        stop_number (int): stop id to get data from.
+        downloader (AsyncDownloader): downloader used to get the stop page.
+        source (str): name of the source of the stop.
+
+    Returns:
+        Tuple[Register]
+    """
+    source = get_source(source)
+
+    with METRICS.timer('fetch'):
+        r = await downloader.get(source.url(stop_number))
+    METRICS.increment('fetched_bytes', len(r.content))
+
+    with METRICS.timer('parse'):
+        registers = tuple(source.parse(r.content, stop_number))
+    for register in registers:
+        register.source = source.name
+    METRICS.increment('parsed_registers', len(registers))
+
+    try:
+        SNAPSHOTS.publish(source.cache_key(stop_number), [vars(x) for x in registers])
+    except OSError:
+        logging.getLogger(__name__).warning('Could not publish snapshot of stop %d', stop_number,
+                                            exc_info=True)
+
+    return registers
+
 
-def analyse_stop(stop_number: int, lines=None):
+async def analyse_stop_async(stop_number: int, lines=None, max_age=None, downloader=None,
+                             source=DEFAULT_SOURCE):
     """Gets data from a bus stop.
 
     Args:
         stop_number (int): stop id to get data from.
         lines (int, Iterable): line or lines to get data from.
+        max_age (int | float): if set, the data is taken from the snapshot cache when it is
+            not older than max_age seconds. Otherwise, the stop is scraped.
+        downloader (AsyncDownloader): downloader to use. If it is None, a new one is created.
+        source (str): name of the source of the stop.
     """
-    if lines is None:
-        lines = None
-    elif isinstance(lines, int):
-        lines = (str(lines),)
-    elif isinstance(lines, str):
-        lines = (lines,)
-    else:
-        lines = tuple([str(x) for x in lines])
-
-    d = Downloader(silenced=True)
-    r = d.get(f'http://www.auvasa.es/parada.asp?codigo={stop_number}')
-    s = Soup(r.content, 'html.parser')
-
-    search = s.findAll('tr')
-    output = []
-
-    for item in search:
-        search2 = list(item.findAll('td'))
-        if search2 is None:
-            continue
-        if len(search2) == 0:
-            continue
-        t = [x.text for x in search2]
-        try:
-            if '+' in t[-1]:
-                t[-1] = 999
-            register = Register(t[0], datetime.today().strftime('%Y-%m-%d %H:%M:%S'), int(t[-1]),
-                                stop_number)
-        except ValueError:
-            continue
-
-        if lines is not None:
-            if register.line in lines:
-                output.append(register)
+    if lines is not None:
+        lines = normalize_lines(lines)
+
+    registers = None
+    if max_age is not None:
+        cached = SNAPSHOTS.get(get_source(source).cache_key(stop_number), max_age)
+        if cached is not None:
+            registers = tuple(Register(**x) for x in cached)
+
+    if registers is None:
+        if downloader is None:
+            async with AsyncDownloader(silenced=True, rate_limiter=LIMITER) as downloader:
+                registers = await fetch_stop(stop_number, downloader, source)
         else:
-            output.append(register)
+            registers = await fetch_stop(stop_number, downloader, source)
+
+    if lines is None:
+        return registers
+    return tuple(x for x in registers if x.line in lines)
+
+
+async def analyse_stops_async(stops, max_age=None):
+    """Gets data from several bus stops concurrently, sharing one downloader.
 
-    return tuple(output)
+    Args:
+        stops (Iterable[tuple]): stop id, lines and, optionally, the name of the source of
+            each stop (default is DEFAULT_SOURCE).
+        max_age (int | float): maximum age of the cached data, see analyse_stop_async.
+
+    Returns:
+        List[Tuple[Register]]: the registers of each stop, in the same order.
+    """
+    async with AsyncDownloader(silenced=True, rate_limiter=LIMITER) as downloader:
+        return await asyncio.gather(*[
+            analyse_stop_async(stop[0], stop[1], max_age, downloader, *stop[2:])
+            for stop in stops
+        ])
+
+
+def analyse_stop(stop_number: int, lines=None, max_age=None, source=DEFAULT_SOURCE):
+    """Blocking version of analyse_stop_async."""
+    return asyncio.run(analyse_stop_async(stop_number, lines, max_age, source=source))
+
+
+def analyse_stops(stops, max_age=None):
+    """Blocking version of analyse_stops_async."""
+    return asyncio.run(analyse_stops_async(stops, max_age))
 
 
 # noinspection PyBroadException
 def generate_data():
-    """Gets all the data from some set bus stops."""
+    """Gets the data of the watchlist entries that are due.
+
+    Each stop is fetched once, no matter how many entries it has, and a snapshot read by
+    another process (like warner) in the last SNAPSHOT_MAX_AGE seconds is reused.
+    """
     logger = logging.getLogger(__name__)
 
     try:
-        registers = load_registers()
-        registers += analyse_stop(stop_number=686, lines=2)  # Gamazo
-        registers += analyse_stop(stop_number=682, lines=8)  # Fray luis de león
-        registers += analyse_stop(stop_number=812, lines=(2, 8))  # Fuente dorada
-        registers += analyse_stop(stop_number=833, lines=(2, 8))  # Clínico
-        registers += analyse_stop(stop_number=880, lines=2)  # Donde nos deja el 2 en ciencias
-        registers += analyse_stop(stop_number=1191, lines=8)  # Parada anterior a la del campus
-        registers += analyse_stop(stop_number=1358, lines=8)  # Campus miguel delibes
-
-        save_registers(registers)
+        entries = SCHEDULER.due()
+        if not entries:
+            logger.debug('No watchlist entries due')
+            return
+
+        registers = []
+        for stop_registers in analyse_stops(merge_entries(entries), SNAPSHOT_MAX_AGE):
+            registers += stop_registers
+
+        append_registers(registers)
+        SCHEDULER.mark_polled(entries)
     except Exception:
         if LINUX is False:
             raise
@@ -250,18 +349,87 @@ def update_database():
 
     data = load_registers()
 
-    saved_ids = DataBase.get_ids()
-    new_ids = [x.id for x in data if x.id not in saved_ids]
+    DB.use()
+    retention = Retention(DATABASE_PATH)
+    archived_until = retention.archived_until()
+    late_saved = late_rejected = 0
+    if archived_until is not None:
+        late = [x for x in data if x.actual_datetime < str(archived_until)]
+        data = [x for x in data if x.actual_datetime >= str(archived_until)]
+        if late:
+            late_saved, late_rejected = retention.insert_archived(late)
+            print(f'Saved {late_saved} registers of archived months')
+        if late_rejected:
+            print(f'{late_rejected} registers of downsampled months could not be saved')
+
+    saved_ids = DB.get_ids()
+    new_ids = {x.id for x in data if x.id not in saved_ids}
 
     registers_number = len(new_ids)
 
     print(f'Found {registers_number} new registers')
 
+    if registers_number >= BULK_LOAD_THRESHOLD:
+        print('Using bulk load mode')
+        with DB.bulk_load():
+            saved = DB.insert_multiple_registers(data, saved_ids)
+    else:
+        saved = DB.insert_multiple_registers(data, saved_ids)
+
+    new_registers = {x.id: x for x in data if x.id not in saved_ids}.values()
+    arrivals = update_arrivals(new_registers)
+    print(f'Found {arrivals} new arrivals')
+
+    stats = DelayStats(DATABASE_PATH, STATS_CACHE_PATH)
+    with METRICS.timer('stats'):
+        stats.refresh()
+
+    with METRICS.timer('retention'):
+        archived, downsampled = retention.apply(stats=stats)
+    if archived or downsampled:
+        print(f'Archived {len(archived)} months and downsampled {len(downsampled)} months')
+
+    # The csv file is kept if some registers could not be saved.
+    return registers_number + late_saved + late_rejected, saved + late_saved, True
+
+
+def update_arrivals(registers, epsilon=2):
+    """Groups the new registers with delay 0 into arrivals and saves them in the database.
+
+    The groups still open are saved in GROUPER_STATE_PATH, so only the new registers are
+    processed in each update. The first time (no state and no arrivals saved), every register
+    of the database is processed instead. The arrivals table has no source column, so only the
+    registers of the default source are grouped.
+
+    Args:
+        registers (Iterable[Register]): registers not processed before.
+        epsilon (int): maximum time difference between registers of the same group.
+
+    Returns:
+        int: number of arrivals saved.
+    """
     DB.use()
+    if not os.path.isfile(GROUPER_STATE_PATH):
+        DB.cur.execute('select count(*) from arrivals')
+        if DB.cur.fetchone()[0] == 0:
+            DB.cur.execute('select line, actual_datetime, delay_minutes, stop_id from busstats '
+                           'where delay_minutes=0 and source=?', (DEFAULT_SOURCE,))
+            registers = [Register(*x) for x in DB.cur.fetchall()]
 
-    saved = DB.insert_multiple_registers(data)
+    grouper = OnlineGrouper(epsilon, state_path=GROUPER_STATE_PATH)
+    arrivals = []
 
-    return registers_number, saved, True
+    with METRICS.timer('group'):
+        registers = sorted((x for x in registers
+                            if x.delay_minutes == 0 and x.source == DEFAULT_SOURCE),
+                           key=lambda x: x.actual_datetime)
+        for register in registers:
+            arrivals += grouper.add(BSRegister(register.line, register.actual_datetime),
+                                    register.stop_id)
+
+    saved = DB.insert_arrivals(arrivals)
+    grouper.save()
+    return saved
 
 
 def main_update_database():
@@ -309,14 +477,6 @@ def get_auto():
 
     print('Starting Bus Stats Transfer Protocol')
 
-    def create_token():
-        print('Creating token')
-        today = datetime.today()
-        anything = (today.year, today.month, today.day)
-
-        token = encrypt(repr(anything))
-        return token
-
     downloader = Downloader()
     file_request = downloader.get(SERVER_ADDRESS)
 
@@ -339,6 +499,18 @@ def get_auto():
         print(f'Error getting file: {temp_pat.search(file_request.text).group(1)}')
 
 
+def report_metrics():
+    """Shows the timings and counters of the run."""
+    summary = METRICS.summary()
+    if not summary:
+        return
+
+    if LINUX is True:
+        logging.getLogger(__name__).info('Run summary:\n%s', summary)
+    else:
+        print('Run summary:\n' + summary)
+
+
 def bus_stats_interface():
     if len(sys.argv) == 1 and LINUX is True:
         sys.argv.append('-generate')
@@ -350,25 +522,28 @@ def bus_stats_interface():
     group.add_argument('-registers', '-number', action='store_true')
     group.add_argument('-get', action='store_true')
     group.add_argument('-all', action='store_true', help='union of -get and -update')
+    parser.add_argument('-profile', '--profile', nargs='?', const='cprofile', choices=MODES,
+                        help='profile the run, saving the output next to the log')
 
     opt = vars(parser.parse_args())
 
-    if opt['generate'] is True:
-        generate_data()
-        exit()
-    elif opt['update'] is True:
-        main_update_database()
-        exit()
-    elif opt['get'] is True:
-        get_auto()
-        exit()
-    elif opt['registers'] is True:
-        print(f'{get_length_database()} registers saved in database')
-        exit()
-    elif opt['all'] is True:
-        get_auto()
-        main_update_database()
-        exit()
+    try:
+        with profile(opt['profile'], os.path.dirname(LOG_PATH), 'busstats'):
+            if opt['generate'] is True:
+                generate_data()
+            elif opt['update'] is True:
+                main_update_database()
+            elif opt['get'] is True:
+                get_auto()
+            elif opt['registers'] is True:
+                print(f'{get_length_database()} registers saved in database')
+            elif opt['all'] is True:
+                get_auto()
+                main_update_database()
+    finally:
+        report_metrics()
+
+    exit()
 
 
 if __name__ == '__main__':
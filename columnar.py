@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Export and import of the busstats and arrivals tables as parquet files.
+
+Each table is exported to a folder with one parquet file per day (hive style, like
+busstats/date=2019-02-04/part-0.parquet), with dictionary encoded line and stop columns and
+real timestamps, so the data can be read by any tool with parquet support. The rows are read
+from the database in batches and each day is written as soon as it is complete.
+"""
+
+import argparse
+import datetime as dt
+import glob
+import logging
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from atomic import atomic_write
+from connection_pool import POOL
+from database import DATABASE_PATH, bulk_load, create_schema
+from retention import Retention
+from sources import Register, register_id
+
+BATCH_SIZE = 50000
+
+# Columns of each table and their arrow types. The line, stop and source columns are dictionary
+# encoded, as there are only a few different values.
+TABLES = {
+    'busstats': (('line', pa.string()), ('actual_datetime', pa.timestamp('s')),
+                 ('delay_minutes', pa.int16()), ('stop_id', pa.int32()), ('source', pa.string())),
+    'arrivals': (('line', pa.string()), ('stop_id', pa.int32()),
+                 ('arrival_datetime', pa.timestamp('s'))),
+}
+DICTIONARY_COLUMNS = ('line', 'stop_id', 'source')
+
+logger = logging.getLogger(__name__)
+
+
+def _datetime_column(table):
+    return [name for name, kind in TABLES[table] if pa.types.is_timestamp(kind)][0]
+
+
+def _to_arrow(table, rows):
+    columns = list(zip(*rows))
+    arrays = []
+    for (name, kind), values in zip(TABLES[table], columns):
+        if pa.types.is_timestamp(kind):
+            array = pa.array(np.array(values, dtype='datetime64[s]'), kind)
+        else:
+            array = pa.array(values, kind)
+        if name in DICTIONARY_COLUMNS:
+            array = array.dictionary_encode()
+        arrays.append(array)
+
+    return pa.Table.from_arrays(arrays, [name for name, _ in TABLES[table]])
+
+
+def _to_python(array):
+    if isinstance(array, pa.DictionaryArray):
+        dictionary = np.array(array.dictionary.to_pylist(), dtype=object)
+        return dictionary[array.indices.to_numpy()].tolist()
+    if pa.types.is_timestamp(array.type):
+        values = np.datetime_as_string(array.to_numpy().astype('datetime64[s]'), unit='s')
+        return np.char.replace(values, 'T', ' ').tolist()
+    return array.to_pylist()
+
+
+class Exporter:
+    """Writes the rows of a table, sorted by datetime, to one parquet file per day.
+
+    Args:
+        folder (str): folder of the exported table.
+        table (str): name of the table, from TABLES.
+    """
+
+    def __init__(self, folder, table):
+        self.folder = folder
+        self.table = table
+        self.files = []
+        self.rows = 0
+
+        self._day = None
+        self._buffer = []
+        self._parts = {}
+
+    def add(self, rows):
+        """Adds rows sorted by datetime (after the rows added before)."""
+        position = [name for name, _ in TABLES[self.table]].index(_datetime_column(self.table))
+        for row in rows:
+            day = row[position][:10]
+            if day != self._day:
+                self.flush()
+                self._day = day
+            self._buffer.append(row)
+
+    def flush(self):
+        """Writes the rows of the current day."""
+        if not self._buffer:
+            return
+
+        part = self._parts.get(self._day, 0)
+        self._parts[self._day] = part + 1
+        folder = os.path.join(self.folder, self.table, f'date={self._day}')
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'part-{part}.parquet')
+
+        with atomic_write(path, 'wb') as fh:
+            pq.write_table(_to_arrow(self.table, self._buffer), fh)
+
+        self.files.append(path)
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+
+def export_tables(folder, path=None, start=None, end=None, batch_size=BATCH_SIZE):
+    """Exports the busstats (including the raw partitions of retention.Retention) and arrivals
+    tables to parquet files.
+
+    Args:
+        folder (str): destination folder.
+        path (str): path of the database. Default is DATABASE_PATH.
+        start (datetime.date): first day to export. Default is the first day saved.
+        end (datetime.date): last day to export (included). Default is the last day saved.
+        batch_size (int): number of rows read from the database at once.
+
+    Returns:
+        Dict[str, int]: number of rows exported of each table.
+    """
+    path = path or DATABASE_PATH
+    sources = {'busstats': Retention(path).covering(start, end) + [path], 'arrivals': [path]}
+    exported = {}
+
+    for table, paths in sources.items():
+        exporter = Exporter(folder, table)
+        column = _datetime_column(table)
+        query = f'select {", ".join(x for x, _ in TABLES[table])} from {table} where 1'
+        parameters = []
+        if start is not None:
+            query += f' and {column} >= ?'
+            parameters.append(str(start))
+        if end is not None:
+            query += f' and {column} < ?'
+            parameters.append(str(end + dt.timedelta(days=1)))
+
+        for source in paths:
+            cursor = POOL.get(source, readonly=True).cursor()
+            try:
+                cursor.execute(query + f' order by {column}', parameters)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    exporter.add(rows)
+            finally:
+                cursor.close()
+            if source != path:
+                POOL.discard(source, readonly=True)
+
+        exporter.flush()
+        logger.info('Exported %d rows of %s to %d files', exporter.rows, table,
+                    len(exporter.files))
+        exported[table] = exporter.rows
+
+    return exported
+
+
+def import_tables(folder, path=None):
+    """Imports the parquet files of export_tables to the database.
+
+    The columns are converted to python values at once per record batch, and the registers
+    already saved are ignored. The days of busstats already archived by retention.Retention are
+    saved in their partitions (see Retention.insert_archived), except the ones of downsampled
+    months, which are skipped with a warning.
+
+    Args:
+        folder (str): folder with the exported tables.
+        path (str): path of the database. Default is DATABASE_PATH.
+
+    Returns:
+        Dict[str, int]: number of rows inserted in each table.
+    """
+    path = path or DATABASE_PATH
+    connection = POOL.get(path)
+    create_schema(connection)
+    retention = Retention(path)
+    archived_until = f'date={retention.archived_until() or ""}'
+    imported = {}
+    rejected = 0
+
+    with bulk_load(connection):
+        for table, columns in TABLES.items():
+            names = [name for name, _ in columns]
+            files = sorted(glob.glob(os.path.join(folder, table, '*', '*.parquet')))
+            imported[table] = 0
+
+            for file in files:
+                archived = table == 'busstats' and \
+                    os.path.basename(os.path.dirname(file)) < archived_until
+                if archived:
+                    # Partitions can not be attached inside a transaction.
+                    connection.commit()
+
+                for batch in pq.read_table(file, columns=names).to_batches():
+                    values = [_to_python(batch.column(i)) for i in range(len(names))]
+
+                    if archived:
+                        saved, batch_rejected = retention.insert_archived(
+                            Register(*x) for x in zip(*values))
+                        imported[table] += saved
+                        rejected += batch_rejected
+                        continue
+
+                    if table == 'busstats':
+                        lines, datetimes, delays, stops, sources = values
+                        ids = [register_id(*x) for x in zip(lines, datetimes, stops, sources)]
+                        rows = zip(ids, lines, datetimes, delays, stops, sources)
+                        query = 'insert or ignore into busstats values (?,?,?,?,?,?)'
+                    else:
+                        rows = zip(*values)
+                        query = 'insert or ignore into arrivals values (?,?,?)'
+
+                    imported[table] += connection.executemany(query, rows).rowcount
+
+            logger.info('Imported %d rows of %s from %d files', imported[table], table,
+                        len(files))
+
+    if rejected:
+        logger.warning('%d rows of busstats were not imported, as their months have been '
+                       'downsampled', rejected)
+    return imported
+
+
+def _parse_date(value):
+    return dt.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='BusStatsParquet')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-export', metavar='FOLDER', help='export the database to a folder')
+    group.add_argument('-import', dest='import_', metavar='FOLDER',
+                       help='import a folder to the database')
+    parser.add_argument('-database', default=DATABASE_PATH)
+    parser.add_argument('-from', dest='start', type=_parse_date, help='first day (YYYY-MM-DD)')
+    parser.add_argument('-to', dest='end', type=_parse_date, help='last day (YYYY-MM-DD)')
+    opt = parser.parse_args()
+
+    if opt.export:
+        result = export_tables(opt.export, opt.database, opt.start, opt.end)
+    else:
+        result = import_tables(opt.import_, opt.database)
+
+    for table, rows in result.items():
+        print(f'{table}: {rows} rows')
+
+
+if __name__ == '__main__':
+    main()
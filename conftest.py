@@ -0,0 +1,30 @@
+import sqlite3
+
+import pytest
+
+from connection_pool import POOL
+from database import create_schema
+
+
+@pytest.fixture
+def make_database(tmp_path):
+    """Returns a function that creates a database with the schema of database.create_schema.
+
+    The function takes the registers (sources.Register) and arrivals (line, stop id and
+    datetime) to insert, and optionally the path of the database, and returns the path.
+    """
+
+    def make(registers=(), arrivals=(), path=None):
+        path = str(path or tmp_path / 'busstats.sqlite')
+        connection = sqlite3.connect(path)
+        create_schema(connection)
+        connection.executemany('insert into busstats values (?,?,?,?,?,?)', [
+            (x.id, x.line, x.actual_datetime, x.delay_minutes, x.stop_id, x.source)
+            for x in registers])
+        connection.executemany('insert into arrivals values (?,?,?)', arrivals)
+        connection.commit()
+        connection.close()
+        return path
+
+    yield make
+    POOL.close_all()
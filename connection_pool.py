@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Shared sqlite connections, one per thread and database."""
+
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+
+CACHED_STATEMENTS = 256
+
+
+class ConnectionPool:
+    """Keeps one open connection per thread, database path and mode.
+
+    Connections are reused between DataBase and DBConnection instances, so the connect cost and
+    the compiled statements (sqlite3 caches them by sql text) are only paid once per thread.
+    Connections inherited from a parent process (after a fork) are never reused.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _key(path, readonly):
+        return os.path.abspath(path), bool(readonly)
+
+    def _thread_connections(self):
+        if os.getpid() != self._pid:
+            # sqlite connections must not be used across a fork, so they are left to the parent.
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+        try:
+            return self._local.connections
+        except AttributeError:
+            self._local.connections = {}
+            return self._local.connections
+
+    def get(self, path, readonly=False):
+        """Returns the connection of the current thread with a database.
+
+        Args:
+            path (str): path of the database.
+            readonly (bool): if True, the database is opened in read only mode, with a bigger
+                cache, so queries can run while an import is in progress.
+
+        Returns:
+            sqlite3.Connection
+        """
+        key = self._key(path, readonly)
+        connections = self._thread_connections()
+
+        connection = connections.get(key)
+        if connection is not None:
+            return connection
+
+        if readonly:
+            uri = pathlib.Path(key[0]).as_uri() + '?mode=ro'
+            connection = sqlite3.connect(uri, uri=True, timeout=30,
+                                         cached_statements=CACHED_STATEMENTS)
+            connection.execute('pragma query_only=1')
+            connection.execute('pragma cache_size=-65536')
+            connection.execute('pragma temp_store=memory')
+        else:
+            connection = sqlite3.connect(path, cached_statements=CACHED_STATEMENTS)
+
+        self.logger.debug('Opened connection with %r (readonly=%r)', path, readonly)
+        connections[key] = connection
+        return connection
+
+    def discard(self, path, readonly=False):
+        """Closes the connection of the current thread with a database, if it exists."""
+        connection = self._thread_connections().pop(self._key(path, readonly), None)
+        if connection is not None:
+            connection.close()
+
+    def close_all(self):
+        """Closes every connection of the current thread."""
+        connections = self._thread_connections()
+        while connections:
+            _, connection = connections.popitem()
+            connection.close()
+
+
+POOL = ConnectionPool()
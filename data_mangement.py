@@ -6,7 +6,7 @@ from input_interface import DBConnection
 
 class DataManager(list):
     def __init__(self, line, stop_id=833, n=None):
-        with DBConnection() as c:
+        with DBConnection(readonly=True) as c:
             super().__init__(c.get_data(line=line, stop_id=stop_id, n=n))
 
     def __add__(self, other):
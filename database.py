@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""Paths and schema of the busstats database, shared by the generator and the tools."""
+
+import os
+from contextlib import contextmanager
+
+from metrics import METRICS
+from sources import DEFAULT_SOURCE
+
+DATABASE_PATH = 'D:/.database/sql/busstats.sqlite'
+GROUPER_STATE_PATH = 'D:/.database/sql/busstats.grouper.json'
+STATS_CACHE_PATH = 'D:/.database/sql/busstats.stats.npz'
+
+BULK_CACHE_SIZE = -262144  # 256 MiB
+DEFAULT_CACHE_SIZE = -2000
+
+# Databases that sqlite can attach to a connection (SQLITE_MAX_ATTACHED).
+MAX_ATTACHED = 10
+
+CREATE_BUSSTATS_SQL = f"""create table if not exists {{schema}}.busstats (
+        id varchar primary key,
+        line varchar not null,
+        actual_datetime varchar not null,
+        delay_minutes integer not null,
+        stop_id integer not null,
+        source varchar not null default '{DEFAULT_SOURCE}')"""
+
+CREATE_INDEX_SQL = 'create index if not exists {schema}.busstats_line_stop ' \
+                   'on busstats (line, stop_id, delay_minutes)'
+
+CREATE_ARRIVALS_SQL = """create table if not exists arrivals (
+        line varchar not null,
+        stop_id integer not null,
+        arrival_datetime varchar not null,
+        primary key (line, stop_id, arrival_datetime))"""
+
+# Months of busstats moved to their own file by retention.Retention. Raw is 0 when the
+# registers of the month have been downsampled and the file deleted.
+CREATE_PARTITIONS_SQL = """create table if not exists partitions (
+        month varchar primary key,
+        path varchar not null,
+        raw integer not null)"""
+
+
+def add_source_column(connection, schema='main'):
+    """Adds the source column to a busstats table created before registers had a source."""
+    columns = [x[1] for x in connection.execute(f'pragma {schema}.table_info(busstats)')]
+    if columns and 'source' not in columns:
+        connection.execute(f'alter table {schema}.busstats add column source varchar not null '
+                           f"default '{DEFAULT_SOURCE}'")
+
+
+def create_schema(connection):
+    """Creates the busstats and arrivals tables, if they don't exist yet.
+
+    Args:
+        connection (sqlite3.Connection): connection with the main database.
+    """
+    connection.execute(CREATE_BUSSTATS_SQL.format(schema='main'))
+    add_source_column(connection)
+    connection.execute(CREATE_INDEX_SQL.format(schema='main'))
+    connection.execute(CREATE_ARRIVALS_SQL)
+
+
+def raw_partitions(connection, start=None, end=None):
+    """Returns the paths of the partitions with raw registers between start and end.
+
+    Args:
+        connection (sqlite3.Connection): connection with the main database.
+        start (datetime.date): first day. Default is the first day archived.
+        end (datetime.date): last day (included). Default is the last day archived.
+
+    Returns:
+        List[str]: paths sorted by month.
+    """
+    exists = connection.execute("select count(*) from sqlite_master where type='table' "
+                                "and name='partitions'").fetchone()[0]
+    if not exists:
+        return []
+
+    first = start.strftime('%Y-%m') if start is not None else ''
+    last = end.strftime('%Y-%m') if end is not None else '9999-12'
+    rows = connection.execute('select path from partitions where raw=1 and month >= ? and '
+                              'month <= ? order by month', (first, last)).fetchall()
+    return [path for path, in rows if os.path.isfile(path)]
+
+
+@contextmanager
+def attach_partitions(connection, paths):
+    """Attaches partitions to a connection.
+
+    Args:
+        connection (sqlite3.Connection): connection with the main database.
+        paths (List[str]): paths of the partitions, at most MAX_ATTACHED - 1.
+
+    Yields:
+        List[str]: schemas of the partitions, in the same order as paths.
+    """
+    attached = []
+    try:
+        for i, path in enumerate(paths):
+            connection.execute(f'attach database ? as partition{i}', (path,))
+            attached.append(f'partition{i}')
+        yield attached
+    finally:
+        for schema in attached:
+            connection.execute(f'detach database {schema}')
+
+
+def union_all(query, schemas):
+    """Joins a query over the busstats table of each schema with union all.
+
+    Args:
+        query (str): query with {schema} in place of the schema of the busstats table.
+        schemas (List[str]): schemas, like the ones of attach_partitions.
+
+    Returns:
+        str
+    """
+    return ' union all '.join(query.format(schema=schema) for schema in schemas)
+
+
+def query_busstats(connection, query, parameters=(), start=None, end=None, archived=None,
+                   order_by=None, main=True):
+    """Runs a query over the busstats table of the main database and of the raw partitions.
+
+    The partitions are attached in chunks of MAX_ATTACHED - 1 (one is left for the partition
+    that retention.Retention attaches), so any number of months can be read.
+
+    Args:
+        connection (sqlite3.Connection): connection with the main database.
+        query (str): query with {schema} in place of the schema of the busstats table.
+        parameters (Sequence): parameters of the query.
+        start (datetime.date): first day. Default is the first day archived.
+        end (datetime.date): last day (included). Default is the last day archived.
+        archived (bool): if the partitions between start and end are read. Default is True
+            only when start or end is given, so queries without a date range only read the
+            hot months of the main database.
+        order_by (str): column to sort the rows of each chunk. As the chunks are read from the
+            oldest month to the newest, the rows are sorted across chunks by datetime columns.
+        main (bool): if False, only the partitions are read.
+
+    Returns:
+        List[tuple]: rows of the partitions, sorted by month, and then rows of the main
+            database.
+    """
+    if archived is None:
+        archived = start is not None or end is not None
+    paths = raw_partitions(connection, start, end) if archived else []
+    chunks = [paths[i:i + MAX_ATTACHED - 1] for i in range(0, len(paths), MAX_ATTACHED - 1)]
+    suffix = f' order by {order_by}' if order_by else ''
+
+    rows = []
+    for chunk in chunks:
+        with attach_partitions(connection, chunk) as schemas:
+            rows += connection.execute(union_all(query, schemas) + suffix,
+                                       tuple(parameters) * len(schemas)).fetchall()
+    if main:
+        rows += connection.execute(query.format(schema='main') + suffix, parameters).fetchall()
+    return rows
+
+
+@contextmanager
+def bulk_load(connection):
+    """Configures a connection for inserting lots of registers.
+
+    The database is switched to WAL, so readers (like the read only connections of the
+    analysis) are not blocked by the import. The journal mode is saved in the database file,
+    so the change is permanent and intended: leaving WAL needs exclusive access, which would
+    fail while a reader is open, and the readers keep that benefit after the import.
+
+    Inside the context the connection uses a bigger page cache and no fsync, and the secondary
+    index is dropped and rebuilt at the end. The last commit is made with full synchronization,
+    so everything imported is on disk when the context ends.
+
+    Args:
+        connection (sqlite3.Connection): connection with the main database.
+    """
+    connection.execute('pragma journal_mode=wal')
+    connection.execute('pragma synchronous=off')
+    connection.execute('pragma temp_store=memory')
+    connection.execute(f'pragma cache_size={BULK_CACHE_SIZE}')
+    connection.execute('drop index if exists busstats_line_stop')
+
+    try:
+        yield connection
+    finally:
+        # In WAL mode a commit with synchronous=full syncs the whole log, including the
+        # frames written while synchronous was off. The pragma can't be changed inside a
+        # transaction, so the pending inserts are committed first.
+        connection.commit()
+        connection.execute('pragma synchronous=full')
+        with METRICS.timer('index'):
+            connection.execute(CREATE_INDEX_SQL.format(schema='main'))
+        connection.commit()
+        connection.execute(f'pragma cache_size={DEFAULT_CACHE_SIZE}')
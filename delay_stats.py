@@ -0,0 +1,318 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Percentiles, histograms and on-time rates of the delays and arrival times.
+
+The registers are aggregated by sql into counts of each value per day, line, stop and hour.
+Those counts are kept as numpy arrays (and saved in a npz file), and only the rows inserted
+after the last aggregation are read again, so each ingested day is aggregated once. As the
+delays and arrival minutes are integers, the percentiles computed from the counts are exact.
+"""
+
+import argparse
+import datetime as dt
+import logging
+
+import numpy as np
+
+from atomic import atomic_write
+from database import STATS_CACHE_PATH, query_busstats
+from input_interface import DBConnection
+from sources import DEFAULT_SOURCE
+
+FIELDS = ('line', 'stop_id', 'weekday', 'hour')
+DEFAULT_PERCENTILES = (50, 90, 99)
+DELAY_BINS = (0, 1, 3, 5, 10, 15, 20, 30, 60)
+ARRIVAL_BINS = tuple(range(24))
+ON_TIME_MINUTES = 5
+
+# Delay shown by auvasa for buses more than 60 minutes away (see sources.parse_stop_page).
+SENTINEL = 999
+
+_DELAY_SQL = f"""select
+        cast(julianday(substr(actual_datetime, 1, 10)) - 2440587.5 as integer),
+        line, stop_id, cast(substr(actual_datetime, 12, 2) as integer), delay_minutes, count(*)
+        from {{table}} where delay_minutes != {SENTINEL}
+            and source = '{DEFAULT_SOURCE}'{{condition}}
+        group by 1, 2, 3, 4, 5"""
+
+# Values are delay minutes for delays and minutes of the day for arrivals.
+_QUERIES = {
+    'delay': ('busstats', _DELAY_SQL.format(table='busstats',
+                                            condition=' and rowid > ? and rowid <= ?')),
+    'arrival': ('arrivals', """select
+        cast(julianday(substr(arrival_datetime, 1, 10)) - 2440587.5 as integer),
+        line, stop_id, cast(substr(arrival_datetime, 12, 2) as integer),
+        cast(substr(arrival_datetime, 12, 2) as integer) * 60
+            + cast(substr(arrival_datetime, 15, 2) as integer), count(*)
+        from arrivals where rowid > ? and rowid <= ?
+        group by 1, 2, 3, 4, 5"""),
+}
+# Delays of the months archived by retention.Retention, only read when the counts are
+# aggregated from scratch.
+_ARCHIVED_DELAY_SQL = _DELAY_SQL.format(table='{schema}.busstats', condition='')
+METRICS = tuple(_QUERIES)
+_COLUMNS = ('day', 'line', 'stop_id', 'hour', 'value', 'count')
+
+
+def _empty():
+    # Rowid -1 means nothing has been aggregated yet (0 is an aggregated empty table).
+    return {'rowid': -1, 'lines': [], **{x: np.zeros(0, dtype=np.int64) for x in _COLUMNS}}
+
+
+class DelayStats:
+    """Statistics of the delays (busstats table) and grouped arrival times (arrivals table).
+
+    Like the arrivals, the delays are only aggregated for the stops of the default source.
+
+    Only the rows appended after the last refresh (with a greater rowid) are aggregated. Rows
+    can be deleted right after a refresh, as their counts are kept, but then rebase must be
+    called, because sqlite reuses the rowids of the deleted rows if the newest row is deleted
+    (retention.Retention.archive does both). If rows are deleted otherwise, reset must be
+    called.
+
+    When the counts are aggregated from scratch (without a cache, or after a reset), the
+    delays of the months archived in raw partitions are read too. The delays of the months
+    already downsampled can not be aggregated again, as only their arrivals are kept.
+
+    Args:
+        path (str): path of the database. Default is input_interface.DATABASE_PATH.
+        cache_path (str): npz file where the aggregated counts are saved. If None, they are only
+            kept in memory.
+    """
+
+    def __init__(self, path=None, cache_path=None):
+        self.path = path
+        self.cache_path = cache_path
+        self.logger = logging.getLogger(__name__)
+        self._data = {metric: _empty() for metric in METRICS}
+
+        if cache_path is not None:
+            self.load()
+
+    def load(self):
+        """Loads the aggregated counts saved in cache_path."""
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as npz:
+                for metric in METRICS:
+                    if f'{metric}.rowid' not in npz:
+                        continue
+                    data = {x: npz[f'{metric}.{x}'] for x in _COLUMNS}
+                    data['rowid'] = int(npz[f'{metric}.rowid'])
+                    data['lines'] = npz[f'{metric}.lines'].tolist()
+                    self._data[metric] = data
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError):
+            self.logger.warning('Corrupted stats cache %r, ignoring it', self.cache_path)
+            self.reset()
+
+    def save(self):
+        """Saves the aggregated counts in cache_path."""
+        arrays = {}
+        for metric, data in self._data.items():
+            arrays.update({f'{metric}.{x}': data[x] for x in _COLUMNS})
+            arrays[f'{metric}.rowid'] = np.array(data['rowid'])
+            arrays[f'{metric}.lines'] = np.array(data['lines'], dtype=str)
+
+        with atomic_write(self.cache_path, 'wb') as fh:
+            np.savez(fh, **arrays)
+
+    def reset(self):
+        """Forgets the aggregated counts, so every register is read again, except the delays of
+        the downsampled months."""
+        self._data = {metric: _empty() for metric in METRICS}
+
+    def rebase(self):
+        """Moves the watermarks back to the newest row left, after rows have been deleted.
+
+        Every row must have been aggregated before the deletion.
+        """
+        with DBConnection(self.path, readonly=True) as connection:
+            for metric, (table, _) in _QUERIES.items():
+                connection.cur.execute(f'select max(rowid) from {table}')
+                rowid = connection.cur.fetchone()[0] or 0
+                self._data[metric]['rowid'] = min(self._data[metric]['rowid'], rowid)
+
+        if self.cache_path is not None:
+            self.save()
+
+    def refresh(self):
+        """Aggregates the rows inserted since the last refresh.
+
+        Returns:
+            int: number of aggregated rows added.
+        """
+        added = 0
+        with DBConnection(self.path, readonly=True) as connection:
+            for metric, (table, query) in _QUERIES.items():
+                data = self._data[metric]
+                connection.cur.execute(f'select max(rowid) from {table}')
+                rowid = connection.cur.fetchone()[0] or 0
+                if rowid < data['rowid']:
+                    self.logger.warning('Rows deleted from %r, aggregating again', table)
+                    data = self._data[metric] = _empty()
+                if rowid == data['rowid']:
+                    continue
+
+                connection.cur.execute(query, (data['rowid'], rowid))
+                rows = connection.cur.fetchall()
+                if metric == 'delay' and data['rowid'] < 0:
+                    rows += query_busstats(connection.con, _ARCHIVED_DELAY_SQL, archived=True,
+                                           main=False)
+                data['rowid'] = rowid
+                if not rows:
+                    continue
+
+                days, lines, stops, hours, values, counts = zip(*rows)
+                codes = {line: code for code, line in enumerate(data['lines'])}
+                for line in lines:
+                    codes.setdefault(line, len(codes))
+                data['lines'] = list(codes)
+
+                new = (days, [codes[x] for x in lines], stops, hours, values, counts)
+                for column, column_values in zip(_COLUMNS, new):
+                    column_values = np.array(column_values, dtype=np.int64)
+                    data[column] = np.concatenate((data[column], column_values))
+                added += len(rows)
+
+        if added and self.cache_path is not None:
+            self.save()
+        self.logger.debug('Aggregated %d rows', added)
+        return added
+
+    def summary(self, metric='delay', by=('line', 'stop_id'), start=None, end=None,
+                percentiles=DEFAULT_PERCENTILES, bins=None, on_time=None, refresh=True):
+        """Computes the statistics of each group of registers.
+
+        Delays are expressed in minutes and arrival times in hours (8:30 is 8.5).
+
+        Args:
+            metric (str): 'delay' or 'arrival'.
+            by (Iterable[str]): fields that define the groups, from FIELDS. Weekdays go from 0
+                (monday) to 6 (sunday).
+            start (datetime.date): first day. Default is the first day saved.
+            end (datetime.date): last day (included). Default is the last day saved.
+            percentiles (Iterable[int | float]): percentiles to compute, from 0 to 100.
+            bins (Iterable[int | float]): left edges of the histogram bins. The last bin has no
+                right edge. Default is DELAY_BINS for delays and ARRIVAL_BINS for arrivals.
+            on_time (int | float): if given, the share of values not greater than on_time is
+                computed. Default is ON_TIME_MINUTES for delays.
+            refresh (bool): if True, the rows inserted since the last refresh are aggregated
+                before computing the statistics.
+
+        Returns:
+            List[dict]: fields of the group, count, percentiles (as p50, p90...), histogram and
+                on_time of each group, sorted by group.
+        """
+        if metric not in _QUERIES:
+            raise ValueError(f'Invalid metric: {metric!r}')
+        by = tuple(by)
+        invalid = set(by) - set(FIELDS)
+        if invalid:
+            raise ValueError(f'Invalid fields: {sorted(invalid)}')
+
+        if refresh:
+            self.refresh()
+
+        if metric == 'delay':
+            scale = 1
+            bins = DELAY_BINS if bins is None else bins
+            on_time = ON_TIME_MINUTES if on_time is None else on_time
+        else:
+            scale = 60
+            bins = ARRIVAL_BINS if bins is None else bins
+
+        data = self._data[metric]
+        mask = np.ones(len(data['day']), dtype=bool)
+        if start is not None:
+            mask &= data['day'] >= (start - dt.date(1970, 1, 1)).days
+        if end is not None:
+            mask &= data['day'] <= (end - dt.date(1970, 1, 1)).days
+
+        columns = {'line': data['line'][mask], 'stop_id': data['stop_id'][mask],
+                   'weekday': (data['day'][mask] + 3) % 7, 'hour': data['hour'][mask]}
+        values = data['value'][mask]
+        counts = data['count'][mask]
+
+        if len(values) == 0:
+            return []
+
+        # Each group is encoded as a single integer (mixed radix), much faster to sort than rows.
+        radixes = [int(columns[x].max()) + 1 for x in by]
+        codes = np.zeros(len(values), dtype=np.int64)
+        for field, radix in zip(by, radixes):
+            codes = codes * radix + columns[field]
+        unique, groups = np.unique(codes, return_inverse=True)
+
+        keys = np.zeros((len(unique), len(by)), dtype=np.int64)
+        for i, radix in reversed(list(enumerate(radixes))):
+            unique, keys[:, i] = np.divmod(unique, radix)
+
+        width = int(values.max()) + 1
+        matrix = np.bincount(groups * width + values, weights=counts,
+                             minlength=len(keys) * width).reshape(len(keys), width)
+        cumulative = np.hstack((np.zeros((len(keys), 1)), matrix.cumsum(axis=1)))
+        total = cumulative[:, -1]
+
+        result = {'count': total.astype(np.int64)}
+        for q in percentiles:
+            result[f'p{q:g}'] = self._percentile(cumulative[:, 1:], total, q) / scale
+
+        edges = np.clip(np.ceil(np.asarray(bins, dtype=float) * scale).astype(np.int64),
+                        0, width)
+        result['histogram'] = cumulative[:, np.append(edges[1:], width)] - cumulative[:, edges]
+
+        if on_time is not None:
+            limit = min(int(np.floor(on_time * scale)) + 1, width)
+            result['on_time'] = cumulative[:, max(limit, 0)] / total
+
+        output = []
+        for i, key in enumerate(keys):
+            row = {}
+            for field, value in zip(by, key):
+                row[field] = data['lines'][value] if field == 'line' else int(value)
+            for name, array in result.items():
+                value = array[i]
+                row[name] = value.astype(int).tolist() if name == 'histogram' else value.item()
+            output.append(row)
+
+        return sorted(output, key=lambda x: tuple(x[field] for field in by))
+
+    @staticmethod
+    def _percentile(cumulative, total, q):
+        # Same as numpy.percentile (linear interpolation) over the expanded values.
+        rank = (total - 1) * q / 100
+        lower = np.floor(rank)
+        upper = np.ceil(rank)
+        value_lower = (cumulative <= lower[:, None]).sum(axis=1)
+        value_upper = (cumulative <= upper[:, None]).sum(axis=1)
+        return value_lower + (value_upper - value_lower) * (rank - lower)
+
+
+def _parse_date(value):
+    return dt.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='BusStatsDelays')
+    parser.add_argument('-metric', choices=METRICS, default='delay')
+    parser.add_argument('-by', nargs='*', choices=FIELDS, default=['line', 'stop_id'])
+    parser.add_argument('-from', dest='start', type=_parse_date, help='first day (YYYY-MM-DD)')
+    parser.add_argument('-to', dest='end', type=_parse_date, help='last day (YYYY-MM-DD)')
+    parser.add_argument('-on-time', dest='on_time', type=float)
+    parser.add_argument('-database', help='path of the database')
+    parser.add_argument('-cache', default=STATS_CACHE_PATH,
+                        help='npz file of the aggregated counts')
+    opt = parser.parse_args()
+
+    stats = DelayStats(opt.database, opt.cache)
+    rows = stats.summary(opt.metric, opt.by, opt.start, opt.end, on_time=opt.on_time)
+
+    for row in rows:
+        print(', '.join(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}'
+                        for key, value in row.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ import logging
 
 import requests
 
+from metrics import METRICS
+
 HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 '
                          '(KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
 
@@ -15,27 +17,37 @@ class DownloaderError(ConnectionError):
 
 
 class Downloader(requests.Session):
-    """Downloader with retries control."""
+    """Downloader with retries control.
+
+    If a rate limiter is given, every attempt (retries included) waits for a token of the host.
+    """
 
-    def __init__(self, retries=10, silenced=False):
+    def __init__(self, retries=10, silenced=False, rate_limiter=None):
         self.logger = logging.getLogger(__name__)
 
         if silenced is True:
             self.logger.handlers = []
 
         self._retries = retries
+        self._rate_limiter = rate_limiter
         super().__init__()
 
+    def _wait(self, url):
+        if self._rate_limiter is not None and self._rate_limiter.acquire(url):
+            METRICS.increment('throttled_requests')
+
     def get(self, url, **kwargs):
         self.logger.debug('GET %r', url)
         retries = self._retries
 
         while retries > 0:
+            self._wait(url)
             try:
                 return super().get(url, **kwargs)
             except requests.exceptions.ConnectionError:
                 retries -= 1
                 self.logger.warning('Connection error in GET, retries=%s', retries)
+                METRICS.increment('download_retries')
 
         self.logger.critical('Download error in GET %r', url)
         raise DownloaderError('max retries failed.')
@@ -45,11 +57,13 @@ class Downloader(requests.Session):
         retries = self._retries
 
         while retries > 0:
+            self._wait(url)
             try:
                 return super().post(url=url, data=data, json=json, **kwargs)
             except requests.exceptions.ConnectionError:
                 retries -= 1
                 self.logger.warning('Connection error in POST, retries=%s', retries)
+                METRICS.increment('download_retries')
 
         self.logger.critical('Download error in POST %r', url)
         raise DownloaderError('max retries failed.')
@@ -59,11 +73,13 @@ class Downloader(requests.Session):
         retries = self._retries
 
         while retries > 0:
+            self._wait(url)
             try:
                 return super().put(url=url, data=data, json=json, **kwargs)
             except requests.exceptions.ConnectionError:
                 retries -= 1
                 self.logger.warning('Connection error in PUT, retries=%s', retries)
+                METRICS.increment('download_retries')
 
         self.logger.critical('Download error in PUT %r', url)
         raise DownloaderError('max retries failed.')
@@ -73,11 +89,13 @@ class Downloader(requests.Session):
         retries = self._retries
 
         while retries > 0:
+            self._wait(url)
             try:
                 return super().delete(url=url, data=data, json=json, **kwargs)
             except requests.exceptions.ConnectionError:
                 retries -= 1
                 self.logger.warning('Connection error in DELETE, retries=%s', retries)
+                METRICS.increment('download_retries')
 
         self.logger.critical('Download error in DELETE %r', url)
         raise DownloaderError('max retries failed.')
@@ -1,9 +1,10 @@
 import datetime as dt
-import sqlite3
 from dataclasses import dataclass, field
 from typing import Union
 
-DATABASE_PATH = 'D:/.database/sql/busstats.sqlite'
+from connection_pool import POOL
+from database import DATABASE_PATH
+from sources import DEFAULT_SOURCE
 
 
 @dataclass
@@ -43,38 +44,101 @@ class BSRegister:
         return f"BSRegister(line={self.line!r}, date='{self.date}', time='{self.time}')"
 
 
+def normalize_lines(line):
+    """Returns a bus line or an iterable of bus lines as a tuple of strings.
+
+    Args:
+        line (str | int | Iterable): bus line or lines.
+
+    Returns:
+        Tuple[str]
+    """
+    if isinstance(line, (str, int)):
+        return (str(line),)
+    return tuple(str(x) for x in line)
+
+
 class DBConnection:
-    """Handles the connection with the Bus Stats Database."""
-    def __init__(self, path=None):
-        self.con = sqlite3.connect(path or DATABASE_PATH)
+    """Handles the connection with the Bus Stats Database.
+
+    The connection is taken from the shared pool, so it is kept open after the context ends, as
+    other holders of the connection (like busdatagenerator.DB) may still use it. When the
+    context ends, the transaction opened inside it is committed, or rolled back if an exception
+    is raised. A transaction already open when the DBConnection was created belongs to another
+    holder, so it is left untouched.
+
+    Args:
+        path (str): path of the database. Default is DATABASE_PATH.
+        readonly (bool): if True, the database is opened in read only mode, with a bigger cache,
+            so the analysis can run while an import is in progress.
+    """
+    def __init__(self, path=None, readonly=False):
+        self.path = path or DATABASE_PATH
+        self.readonly = readonly
+        self.con = POOL.get(self.path, readonly)
         self.cur = self.con.cursor()
+        self._shared_transaction = self.con.in_transaction
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.con.commit()
-        self.con.close()
+        self.cur.close()
+        if self._shared_transaction:
+            return
+        if exc_type is None:
+            self.con.commit()
+        else:
+            self.con.rollback()
 
-    def get_data(self, line, stop_id=833, n=None):
+    def get_data(self, line, stop_id=833, n=None, source=DEFAULT_SOURCE):
         """Gets the bus stats data from the database.
 
+        Only the hot months are read. The months archived by retention.Retention are read with
+        its get_data method.
+
         Args:
-            line (str | int): bus line to filter the data.
+            line (str | int | Iterable): bus line or lines to filter the data.
             stop_id (int): bus stop identification to filter the data. Default is 833, corresponding
                 to the hospital's stop.
             n (int): Maximum number of registers to retrieve. Set None to retrieve all registries.
+            source (str): name of the source of the stop.
+
+        Returns:
+            Tuple[BSRegister]
+        """
+        lines = normalize_lines(line)
+        query = 'select line, actual_datetime from busstats where delay_minutes=0 and ' \
+                f'line in ({", ".join("?" * len(lines))}) and stop_id=? and source=?'
+
+        if not n:
+            packed_data = lines + (int(stop_id), source)
+            self.cur.execute(query, packed_data)
+        else:
+            packed_data = lines + (int(stop_id), source, int(n))
+            self.cur.execute(query + ' limit ?', packed_data)
+        return tuple((BSRegister(*x) for x in self.cur.fetchall()))
+
+    def get_arrivals(self, line, stop_id=833, n=None):
+        """Gets the grouped arrivals (see busdatagenerator.update_arrivals) from the database.
+
+        Arrivals are only grouped for the stops of the default source.
+
+        Args:
+            line (str | int | Iterable): bus line or lines to filter the data.
+            stop_id (int): bus stop identification to filter the data.
+            n (int): Maximum number of arrivals to retrieve. Set None to retrieve all.
 
         Returns:
             Tuple[BSRegister]
         """
+        lines = normalize_lines(line)
+        query = 'select line, arrival_datetime from arrivals where ' \
+                f'line in ({", ".join("?" * len(lines))}) and stop_id=? ' \
+                'order by arrival_datetime'
 
         if not n:
-            packed_data = (str(line), int(stop_id))
-            self.cur.execute('select line, actual_datetime from busstats where'
-                             ' delay_minutes=0 and line=? and stop_id=?', packed_data)
+            self.cur.execute(query, lines + (int(stop_id),))
         else:
-            packed_data = (str(line), int(stop_id), int(n))
-            self.cur.execute('select line, actual_datetime from busstats where'
-                             ' delay_minutes=0 and line=? and stop_id=? limit ?', packed_data)
+            self.cur.execute(query + ' limit ?', lines + (int(stop_id), int(n)))
         return tuple((BSRegister(*x) for x in self.cur.fetchall()))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""Timings and counters of the hot paths, exported in the Prometheus text format."""
+
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('BUSSTATS_METRICS', '1') != '0'
+
+
+class _NullTimer:
+    """Timer used when the metrics are disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 't0')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.t0 = None
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class Metrics:
+    """Registry of timings and counters.
+
+    Args:
+        enabled (bool): if False, timers and counters do nothing. Default is False only if the
+            environment variable BUSSTATS_METRICS is '0'.
+    """
+
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {}
+
+    def timer(self, name):
+        """Returns a context manager that records the time spent inside it.
+
+        Args:
+            name (str): name of the timing (fetch, parse, dedup, write, insert, serve...).
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        """Records a timing of seconds."""
+        if not self.enabled:
+            return
+        with self._lock:
+            count, total, maximum = self._timings.get(name, (0, 0.0, 0.0))
+            self._timings[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def increment(self, name, value=1):
+        """Adds value to a counter (retries, rows, bytes...)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def summary(self):
+        """Returns a human readable summary of the metrics."""
+        with self._lock:
+            lines = [f'{name}: {count} calls, {total:.3f} s total, {maximum:.3f} s max'
+                     for name, (count, total, maximum) in sorted(self._timings.items())]
+            lines += [f'{name}: {value}' for name, value in sorted(self._counters.items())]
+        return '\n'.join(lines)
+
+    def prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (count, total, maximum) in sorted(self._timings.items()):
+                metric = f'busstats_{name}_seconds'
+                lines.append(f'# TYPE {metric} summary')
+                lines.append(f'{metric}_count {count}')
+                lines.append(f'{metric}_sum {total:.6f}')
+                lines.append(f'# TYPE {metric}_max gauge')
+                lines.append(f'{metric}_max {maximum:.6f}')
+
+            for name, value in sorted(self._counters.items()):
+                metric = f'busstats_{name}_total'
+                lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
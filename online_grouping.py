@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""Incremental version of DataManager.group, for registers that arrive over time."""
+
+import json
+import logging
+from typing import Callable
+
+from atomic import atomic_write
+from input_interface import BSRegister
+
+
+class OnlineGrouper:
+    """Groups the registers of each line and stop as they arrive.
+
+    A register joins the open group of its line and stop if it is less than epsilon minutes
+    away from the first register of the group, like in DataManager.group. Otherwise the group is
+    closed and a new one is opened. Groups whose first register is epsilon minutes older than
+    the newest register seen are closed too, and registers that old are ignored. When a group is
+    closed, selector chooses the register that represents it.
+
+    The open groups can be saved to a json file and loaded in the next run, so each register is
+    processed only once.
+
+    Args:
+        epsilon (int): maximum time difference between registers of the same group, in minutes.
+        selector (Callable): function that selects which register of a group remains.
+        state_path (str): json file where the open groups are saved. If it exists, it is loaded.
+    """
+
+    def __init__(self, epsilon: int = 2, selector: Callable = max, state_path=None):
+        self.epsilon = epsilon
+        self.selector = selector
+        self.state_path = state_path
+        self.logger = logging.getLogger(__name__)
+
+        self.watermark = None
+        self._open = {}
+
+        if state_path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._open)
+
+    def add(self, register: BSRegister, stop_id: int):
+        """Assigns a register to a group.
+
+        Args:
+            register (BSRegister): register to group.
+            stop_id (int): stop of the register.
+
+        Returns:
+            List[Tuple[BSRegister, int]]: the groups closed, as pairs of selected register and
+                stop id.
+        """
+        key = (register.line, int(stop_id))
+        group = self._open.get(key)
+        closed = []
+
+        if self.watermark is not None and \
+                (self.watermark - register._datetime).total_seconds() / 60 >= self.epsilon:
+            self.logger.debug('Ignoring late register %r', register)
+            return closed
+
+        if group is not None:
+            if group[0].distance(register) < self.epsilon:
+                group.append(register)
+            else:
+                closed.append(self._close(key))
+                self._open[key] = [register]
+        else:
+            self._open[key] = [register]
+
+        if self.watermark is None or register._datetime > self.watermark:
+            self.watermark = register._datetime
+            closed += self.flush()
+
+        return closed
+
+    def flush(self, now=None):
+        """Closes the groups that can not receive more registers.
+
+        Args:
+            now (datetime.datetime): reference time. Default is the newest register seen.
+
+        Returns:
+            List[Tuple[BSRegister, int]]: the groups closed.
+        """
+        now = now or self.watermark
+        if now is None:
+            return []
+
+        expired = [key for key, group in self._open.items()
+                   if (now - group[0]._datetime).total_seconds() / 60 >= self.epsilon]
+        return [self._close(key) for key in expired]
+
+    def _close(self, key):
+        group = self._open.pop(key)
+        return self.selector(group), key[1]
+
+    def load(self):
+        """Loads the open groups saved in state_path."""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            return
+
+        self.watermark = None
+        self._open = {}
+        for group in state['open']:
+            registers = [BSRegister(group['line'], x) for x in group['datetimes']]
+            self._open[(group['line'], group['stop_id'])] = registers
+            for register in registers:
+                if self.watermark is None or register._datetime > self.watermark:
+                    self.watermark = register._datetime
+
+    def save(self):
+        """Saves the open groups in state_path."""
+        state = {'open': [
+            {'line': line, 'stop_id': stop_id,
+             'datetimes': [x._datetime.strftime('%Y-%m-%d %H:%M:%S') for x in group]}
+            for (line, stop_id), group in self._open.items()
+        ]}
+
+        with atomic_write(self.state_path) as fh:
+            json.dump(state, fh)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Optional profiling of a run, with cProfile or with a low overhead stack sampler."""
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_ENV = 'BUSSTATS_PROFILE'
+MODES = ('cprofile', 'sample')
+
+
+class Sampler(threading.Thread):
+    """Samples periodically the stack of a thread.
+
+    The result is saved in the collapsed stack format ('frame1;frame2;frame3 count'), which can
+    be read by flamegraph.pl or speedscope.
+
+    Args:
+        interval (float): seconds between samples.
+        thread_id (int): identifier of the thread to sample. Default is the current thread.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        super().__init__(name='Sampler', daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                stack.append(f'{module}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+
+
+@contextmanager
+def profile(mode, folder, name):
+    """Profiles the code executed inside the context.
+
+    Args:
+        mode (str): 'cprofile' to save a pstats file, 'sample' to save a collapsed stacks file
+            or None to disable the profiling.
+        folder (str): folder where the output is saved (usually the folder of the log).
+        name (str): prefix of the output file name.
+    """
+    if not mode:
+        yield
+        return
+
+    if mode not in MODES:
+        raise ValueError(f'Invalid profile mode {mode!r}, must be one of {MODES}')
+
+    logger = logging.getLogger(__name__)
+    path = os.path.join(folder or '.', f'{name}-{datetime.today():%Y%m%d-%H%M%S}')
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + '.pstats')
+            logger.info('Profile saved in %r', path + '.pstats')
+        return
+
+    sampler = Sampler()
+    sampler.start()
+    t0 = time.time()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        sampler.save(path + '.collapsed')
+        logger.info('%d samples in %.2f s saved in %r', sum(sampler.stacks.values()),
+                    time.time() - t0, path + '.collapsed')
+
+
+def profile_from_env(folder, name):
+    """Same as profile, but the mode is read from the environment variable BUSSTATS_PROFILE."""
+    return profile(os.environ.get(PROFILE_ENV) or None, folder, name)
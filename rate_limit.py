@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Token bucket rate limiting of the requests made to each host."""
+
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Token bucket: allows bursts of capacity requests and rate requests per second after that.
+
+    Tokens are reserved when requested, so concurrent callers are spaced out instead of all
+    waking up at the same time.
+
+    Args:
+        rate (float): tokens added per second.
+        capacity (int): maximum number of tokens.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self):
+        """Waits until a token is available."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """Waits until a token is available, without blocking the event loop."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class HostRateLimiter:
+    """Keeps a token bucket for each host.
+
+    Args:
+        rate (float): default requests per second for each host.
+        capacity (int): default burst of requests for each host.
+        hosts (dict): rate and capacity of specific hosts (host -> (rate, capacity)).
+    """
+
+    def __init__(self, rate=2.0, capacity=5, hosts=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.hosts = dict(hosts or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        """Returns the token bucket of the host of an url."""
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                rate, capacity = self.hosts.get(host, (self.rate, self.capacity))
+                self._buckets[host] = TokenBucket(rate, capacity)
+            return self._buckets[host]
+
+    def acquire(self, url):
+        return self.bucket(url).acquire()
+
+    async def acquire_async(self, url):
+        return await self.bucket(url).acquire_async()
+
+
+LIMITER = HostRateLimiter(hosts={'www.auvasa.es': (2.0, 5)})
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""In-memory index of the recent registers saved by the generator in the csv file."""
+
+import csv
+import logging
+import os
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from sources import DEFAULT_SOURCE
+
+IndexEntry = namedtuple('IndexEntry', 'line actual_datetime delay_minutes stop_id source',
+                        defaults=(DEFAULT_SOURCE,))
+
+
+class RegisterIndex:
+    """Index of the registers found in the csv file written by the generator.
+
+    The generator appends the new registers at the end of the file (see
+    busdatagenerator.append_registers), so each refresh parses just the bytes added since the
+    last one. If the file is replaced (like when it is deleted after being imported), it is
+    scanned again from the start. Registers older than max_age are discarded and the index
+    survives the deletion of the csv file.
+
+    Args:
+        path (str): path of the csv file.
+        max_age (datetime.timedelta): maximum age of the registers kept in the index.
+    """
+
+    def __init__(self, path, max_age=timedelta(days=2)):
+        self.path = path
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+
+        self._offset = 0
+        self._tail = b''
+        self._keys = set()
+        self._by_stop = defaultdict(list)
+        self._by_line = defaultdict(list)
+        self._line_times = defaultdict(list)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def refresh(self):
+        """Adds the registers appended to the csv file since the last refresh."""
+        try:
+            file_size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self._offset = 0
+            self._tail = b''
+            return 0
+
+        if file_size == self._offset:
+            return 0
+
+        with open(self.path, 'rb') as fh:
+            if not self._is_same_file(fh, file_size):
+                self.logger.debug('File %r has been replaced, rescanning', self.path)
+                self._offset = 0
+                self._tail = b''
+
+            fh.seek(self._offset)
+            content = fh.read(file_size - self._offset)
+
+        end = content.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+
+        lines = content[:end].decode('utf-8').splitlines()
+        if self._offset == 0:
+            lines = lines[1:]
+
+        self._offset += end
+        self._tail = content[max(0, end - 64):end]
+
+        added = 0
+        for row in csv.reader(lines, quotechar='|'):
+            try:
+                entry = IndexEntry(row[0], row[1], int(row[2]), int(row[3]),
+                                   row[4] if len(row) > 4 and row[4] else DEFAULT_SOURCE)
+            except (IndexError, ValueError):
+                continue
+            added += self._add(entry)
+
+        self._prune()
+        self.logger.debug('Indexed %d new registers (%d total)', added, len(self))
+        return added
+
+    def _is_same_file(self, fh, file_size):
+        if not self._offset:
+            return True
+        if file_size < self._offset:
+            return False
+        fh.seek(self._offset - len(self._tail))
+        return fh.read(len(self._tail)) == self._tail
+
+    @staticmethod
+    def _key(entry):
+        return entry.line, entry.actual_datetime, entry.stop_id, entry.source
+
+    def _add(self, entry):
+        key = self._key(entry)
+        if key in self._keys:
+            return 0
+        self._keys.add(key)
+
+        self._by_stop[(entry.source, entry.stop_id)].append(entry)
+
+        times = self._line_times[entry.line]
+        position = bisect_right(times, entry.actual_datetime)
+        times.insert(position, entry.actual_datetime)
+        self._by_line[entry.line].insert(position, entry)
+        return 1
+
+    def _prune(self):
+        limit = (datetime.today() - self.max_age).strftime('%Y-%m-%d %H:%M:%S')
+
+        for line, times in self._line_times.items():
+            position = bisect_left(times, limit)
+            if position:
+                for entry in self._by_line[line][:position]:
+                    self._keys.discard(self._key(entry))
+                del times[:position]
+                del self._by_line[line][:position]
+
+        for entries in self._by_stop.values():
+            position = 0
+            while position < len(entries) and entries[position].actual_datetime < limit:
+                position += 1
+            del entries[:position]
+
+    def latest(self, stop_id, source=DEFAULT_SOURCE):
+        """Returns the registers of the last time the stop was analysed.
+
+        Args:
+            stop_id (int): stop identification.
+            source (str): name of the source of the stop.
+
+        Returns:
+            List[IndexEntry]
+        """
+        entries = self._by_stop.get((source, int(stop_id)))
+        if not entries:
+            return []
+
+        last = entries[-1].actual_datetime
+        position = len(entries) - 1
+        while position > 0 and entries[position - 1].actual_datetime == last:
+            position -= 1
+        return entries[position:]
+
+    def delays(self, line, start=None, end=None, stop_id=None, source=DEFAULT_SOURCE):
+        """Returns the registers of a line between two dates.
+
+        Args:
+            line (str | int): bus line.
+            start (str): lower limit ('YYYY-MM-DD[ HH:MM[:SS]]'), included.
+            end (str): upper limit ('YYYY-MM-DD[ HH:MM[:SS]]'), included.
+            stop_id (int): if set, only the registers of this stop are returned.
+            source (str): name of the source of the registers.
+
+        Returns:
+            List[IndexEntry]
+        """
+        line = str(line)
+        times = self._line_times.get(line, [])
+
+        low = bisect_left(times, start) if start else 0
+        high = bisect_right(times, end + '\uffff') if end else len(times)
+
+        entries = self._by_line[line][low:high] if line in self._by_line else []
+        entries = [entry for entry in entries if entry.source == source]
+        if stop_id is not None:
+            entries = [entry for entry in entries if entry.stop_id == int(stop_id)]
+        return entries
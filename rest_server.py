@@ -1,15 +1,21 @@
+import json
 import logging
 import os
 import platform
+import re
 import socketserver
 import time
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import unquote
+from urllib.parse import parse_qs, unquote, urlparse
 
-from cryptography.fernet import InvalidToken
 from rpi.custom_logging import configure_logging
-from rpi.encryption import decrypt
+
+from auth import TokenVerifier, get_secret
+from metrics import METRICS
+from profiling import profile_from_env
+from register_index import RegisterIndex
+from sources import DEFAULT_SOURCE
 
 configure_logging(name='rest_server')
 
@@ -24,6 +30,13 @@ else:
     OUTPUT_CSV = 'D:/Sistema/Downloads/busstats.test.csv'
     SERVER_ADDRESS = 'http://localhost:5415'
 
+VERIFIER = TokenVerifier()
+INDEX = RegisterIndex(SOURCE_CSV)
+
+STOP_LATEST_PATTERN = re.compile(r'/stops/(\d+)/latest')
+LINE_DELAYS_PATTERN = re.compile(r'/lines/(\w+)/delays')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}(?::\d{2})?)?')
+
 
 def get_bus_data(get=False, delete=False):
     logger = logging.getLogger(__name__)
@@ -110,11 +123,30 @@ class MyServer(BaseHTTPRequestHandler):
             self.logger.exception('%s - %s', type(ex), ex.__class__.__name__)
 
     def do_GET(self):
+        METRICS.increment('requests')
+        with METRICS.timer('serve'):
+            self.route_get()
+
+    def route_get(self):
         if 'favicon.ico' in self.path:
             return self.favicon()
 
+        url = urlparse(self.path)
+
+        if url.path == '/metrics':
+            return self.metrics()
+
+        match = STOP_LATEST_PATTERN.fullmatch(url.path)
+        if match:
+            return self.stop_latest(int(match.group(1)), parse_qs(url.query))
+
+        match = LINE_DELAYS_PATTERN.fullmatch(url.path)
+        if match:
+            return self.line_delays(match.group(1), parse_qs(url.query))
+
         if self.path != '/':
             self.send_error(400, 'Invalid URL', 'BUS STATS REST SERVER')
+            return
 
         try:
             content = get_bus_data(get=True)
@@ -133,34 +165,90 @@ class MyServer(BaseHTTPRequestHandler):
         self.end_headers()
 
         self.wfile.write(content)
+        METRICS.increment('served_bytes', len(content))
+
+    def send_json(self, data):
+        content = json.dumps(data).encode()
+
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+
+        self.wfile.write(content)
+        METRICS.increment('served_bytes', len(content))
+
+    def metrics(self):
+        content = METRICS.prometheus().encode()
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+
+        self.wfile.write(content)
+
+    def stop_latest(self, stop_id, query):
+        source = query.get('source', [DEFAULT_SOURCE])[-1]
+
+        with METRICS.timer('index_refresh'):
+            INDEX.refresh()
+        registers = INDEX.latest(stop_id, source)
+        if not registers:
+            self.send_error(404, message=f'No recent registers for stop {stop_id}')
+            return
+
+        self.send_json({
+            'stop_id': stop_id,
+            'actual_datetime': registers[0].actual_datetime,
+            'lines': {x.line: x.delay_minutes for x in registers}
+        })
+
+    def line_delays(self, line, query):
+        start = query.get('from', [None])[-1]
+        end = query.get('to', [None])[-1]
+        stop_id = query.get('stop', [None])[-1]
+        source = query.get('source', [DEFAULT_SOURCE])[-1]
+
+        for value in (start, end):
+            if value is not None and not DATE_PATTERN.fullmatch(value):
+                self.send_error(400, message=f'Invalid date: {value!r}',
+                                explain='Dates must be YYYY-MM-DD[ HH:MM[:SS]]')
+                return
+
+        if stop_id is not None and not stop_id.isdigit():
+            self.send_error(400, message=f'Invalid stop: {stop_id!r}')
+            return
+
+        with METRICS.timer('index_refresh'):
+            INDEX.refresh()
+        registers = INDEX.delays(line, start, end, stop_id, source)
+        self.send_json({
+            'line': line,
+            'registers': [
+                {'actual_datetime': x.actual_datetime, 'delay_minutes': x.delay_minutes,
+                 'stop_id': x.stop_id} for x in registers
+            ]
+        })
 
     def send_invalid_token(self):
         self.send_error(403, message='Invalid token')
 
     def do_DELETE(self):
+        client = self.client_address[0]
+        if VERIFIER.is_blocked(client):
+            self.logger.critical('Too many failed attempts from %r', client)
+            self.send_error(429, message='Too many failed attempts')
+            return
+
         post = self.parse_post_data()
         if 'token' not in post:
             self.logger.debug('Missing token')
             self.send_error(403, message='Missing token')
             return
 
-        token = post.get('token')
-
-        try:
-            data = decrypt(token)
-        except InvalidToken:
-            self.logger.critical('Invalid token (decrypting)')
-            return self.send_invalid_token()
-
-        try:
-            data = eval(data)
-        except NameError:
-            self.logger.critical('Invalid token (eval)')
-            return self.send_invalid_token()
-
-        today = datetime.today()
-        if data != (today.year, today.month, today.day):
-            self.logger.critical('Invalid token (comparing)')
+        if not VERIFIER.verify(post.get('token'), client):
+            self.logger.critical('Invalid token')
             return self.send_invalid_token()
 
         result = get_bus_data(delete=True)
@@ -187,14 +275,17 @@ class MyServer(BaseHTTPRequestHandler):
         return
 
 
-def get_server():
-    return HTTPServer(('0.0.0.0', 5415), MyServer)
+def get_server(host='0.0.0.0', port=5415):
+    return HTTPServer((host, port), MyServer)
 
 
 def start_server():
     my_server = get_server()
+    # The secret is created when the server starts, so it can be copied to the clients.
+    get_secret(create=True)
     try:
-        my_server.serve_forever()
+        with profile_from_env(os.path.dirname(LOG_PATH), 'rest_server'):
+            my_server.serve_forever()
     except KeyboardInterrupt:
         pass
     finally:
@@ -0,0 +1,386 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Retention of the busstats table: monthly partitions and downsampling of old registers.
+
+The main database only keeps the raw registers of the last months (hot months). Older months
+are moved to one sqlite file per month, which is only attached by the queries whose date range
+covers it. After some more months, the raw registers of a partition are downsampled: their
+grouped arrivals are kept in the arrivals table of the main database and the partition file is
+deleted.
+"""
+
+import argparse
+import datetime as dt
+import logging
+import os
+import sqlite3
+
+from connection_pool import POOL
+from database import CREATE_BUSSTATS_SQL, CREATE_INDEX_SQL, CREATE_PARTITIONS_SQL, \
+    DATABASE_PATH, MAX_ATTACHED, STATS_CACHE_PATH, add_source_column, query_busstats, \
+    raw_partitions
+from delay_stats import DelayStats
+from input_interface import BSRegister, normalize_lines
+from online_grouping import OnlineGrouper
+from sources import DEFAULT_SOURCE
+
+HOT_MONTHS = 2
+RAW_MONTHS = 12
+PARTITION_FILENAME = 'busstats-{month}.sqlite'
+
+
+class ArchiveError(Exception):
+    """The registers of a month could not be copied to its partition."""
+
+
+def month_start(date, months=0):
+    """Returns the first day of the month of date, moved some months.
+
+    Args:
+        date (datetime.date): any day of the month.
+        months (int): number of months to move (negative to move back).
+
+    Returns:
+        datetime.date
+    """
+    index = date.year * 12 + date.month - 1 + months
+    return dt.date(index // 12, index % 12 + 1, 1)
+
+
+def month_key(date):
+    return date.strftime('%Y-%m')
+
+
+class Retention:
+    """Moves the old registers of the main database to monthly partitions and downsamples them.
+
+    Args:
+        path (str): path of the main database. Default is DATABASE_PATH.
+        folder (str): folder of the partitions. Default is the folder of the main database.
+        hot_months (int): months (including the current one) kept in the main database.
+        raw_months (int): months (including the current one) whose raw registers are kept.
+            Registers of older months are downsampled to arrivals. It can exceed hot_months by
+            database.MAX_ATTACHED at most, the number of partitions sqlite can attach at once.
+        epsilon (int): maximum time difference between registers of the same arrival, in
+            minutes, used when downsampling.
+    """
+
+    def __init__(self, path=None, folder=None, hot_months=HOT_MONTHS, raw_months=RAW_MONTHS,
+                 epsilon=2):
+        if raw_months < hot_months:
+            raise ValueError('raw_months must be greater or equal than hot_months')
+        if raw_months - hot_months > MAX_ATTACHED:
+            raise ValueError(f'raw_months can not exceed hot_months by more than {MAX_ATTACHED}')
+
+        self.path = path or DATABASE_PATH
+        self.folder = folder or os.path.dirname(os.path.abspath(self.path))
+        self.hot_months = hot_months
+        self.raw_months = raw_months
+        self.epsilon = epsilon
+        self.logger = logging.getLogger(__name__)
+
+    def _connection(self, readonly=False):
+        connection = POOL.get(self.path, readonly)
+        if not readonly:
+            connection.execute(CREATE_PARTITIONS_SQL)
+            add_source_column(connection)
+        return connection
+
+    def partitions(self, readonly=False):
+        """Returns the archived months.
+
+        Returns:
+            Dict[str, Tuple[str, bool]]: path of the partition and if it keeps the raw registers
+                (False if it was downsampled) of each month ('YYYY-MM').
+        """
+        connection = self._connection(readonly)
+        try:
+            rows = connection.execute('select month, path, raw from partitions').fetchall()
+        except sqlite3.OperationalError:
+            # Read only connections can not create the table, so it may not exist.
+            if not readonly:
+                raise
+            return {}
+        return {month: (path, bool(raw)) for month, path, raw in rows}
+
+    def archived_until(self, readonly=False):
+        """Returns the first day not archived, or None if nothing has been archived.
+
+        Registers older than that day must not be inserted in the main database, but in their
+        partitions (see insert_archived).
+        """
+        months = self.partitions(readonly)
+        if not months:
+            return None
+        return month_start(dt.datetime.strptime(max(months), '%Y-%m').date(), 1)
+
+    def apply(self, today=None, stats=None):
+        """Archives and downsamples the months that are old enough.
+
+        Args:
+            today (datetime.date): reference day. Default is today.
+            stats (delay_stats.DelayStats): statistics of the database, see archive.
+
+        Returns:
+            Tuple[List[str], List[str]]: months archived and months downsampled.
+        """
+        today = today or dt.date.today()
+        return self.archive(month_start(today, 1 - self.hot_months), stats), \
+            self.downsample(month_start(today, 1 - self.raw_months))
+
+    def archive(self, until, stats=None):
+        """Moves the registers older than until to the monthly partitions.
+
+        A transaction over attached databases is not atomic in WAL mode, so each month is moved
+        in two steps: the registers are copied to the partition and committed, and only when
+        every register is found in the partition they are deleted from the main database, in
+        the same transaction that records the partition. If the process stops between both
+        steps, the month is copied again in the next run.
+
+        Args:
+            until (datetime.date): first day of the first month kept in the main database.
+            stats (delay_stats.DelayStats): if given, the statistics are refreshed before the
+                registers are deleted and rebased after, so they keep the counts of the archived
+                registers and still find the new ones.
+
+        Returns:
+            List[str]: months archived.
+
+        Raises:
+            ArchiveError: if some registers of a month are missing in its partition.
+        """
+        connection = self._connection()
+        archived = []
+
+        while True:
+            # The oldest register left is in the next month to archive, so months without
+            # registers are skipped.
+            first = connection.execute('select min(actual_datetime) from busstats').fetchone()[0]
+            if first is None:
+                break
+            start = month_start(dt.datetime.strptime(first[:10], '%Y-%m-%d').date())
+            if start >= month_start(until):
+                break
+
+            end = month_start(start, 1)
+            month = month_key(start)
+            path = os.path.join(self.folder, PARTITION_FILENAME.format(month=month))
+
+            parameters = (str(start), str(end))
+            connection.execute('attach database ? as archive', (path,))
+            try:
+                self._create_partition(connection)
+                connection.execute('insert or ignore into archive.busstats select * '
+                                   'from main.busstats where actual_datetime >= ? and '
+                                   'actual_datetime < ?', parameters)
+                connection.commit()
+
+                missing = connection.execute(
+                    'select count(*) from main.busstats where actual_datetime >= ? and '
+                    'actual_datetime < ? and id not in (select id from archive.busstats)',
+                    parameters).fetchone()[0]
+                if missing:
+                    raise ArchiveError(f'{missing} registers of {month} are missing in {path!r}')
+
+                if stats is not None:
+                    stats.refresh()
+                moved = connection.execute('delete from main.busstats where actual_datetime >= ? '
+                                           'and actual_datetime < ?', parameters).rowcount
+                connection.execute('insert or replace into partitions values (?, ?, 1)',
+                                   (month, path))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.execute('detach database archive')
+
+            if stats is not None:
+                stats.rebase()
+            self.logger.info('Archived %d registers of %s in %r', moved, month, path)
+            archived.append(month)
+
+        return archived
+
+    def insert_archived(self, registers):
+        """Saves registers of archived months in their partitions.
+
+        The registers of the months already downsampled can not be saved, as their partitions
+        have been deleted. The registers saved are not added to the arrivals nor to the delay
+        statistics.
+
+        Args:
+            registers (Iterable[sources.Register]): registers older than archived_until.
+
+        Returns:
+            Tuple[int, int]: number of registers saved (the ones already saved are ignored) and
+                number of registers of downsampled months.
+        """
+        months = {}
+        for register in registers:
+            months.setdefault(register.actual_datetime[:7], []).append(register)
+
+        connection = self._connection()
+        partitions = self.partitions()
+        saved = rejected = 0
+
+        for month, month_registers in sorted(months.items()):
+            default = os.path.join(self.folder, PARTITION_FILENAME.format(month=month))
+            path, raw = partitions.get(month, (default, True))
+            if not raw:
+                self.logger.warning('%d registers of %s were not saved, as the month has been '
+                                    'downsampled', len(month_registers), month)
+                rejected += len(month_registers)
+                continue
+
+            connection.execute('attach database ? as archive', (path,))
+            try:
+                self._create_partition(connection)
+                saved += connection.executemany(
+                    'insert or ignore into archive.busstats values (?,?,?,?,?,?)',
+                    [(x.id, x.line, x.actual_datetime, x.delay_minutes, x.stop_id, x.source)
+                     for x in month_registers]).rowcount
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.execute('detach database archive')
+
+            if month not in partitions:
+                # Months older than the last one archived are skipped by archive if they have no
+                # registers, so they may not have a partition yet.
+                connection.execute('insert into partitions values (?, ?, 1)', (month, path))
+                connection.commit()
+
+        return saved, rejected
+
+    @staticmethod
+    def _create_partition(connection):
+        connection.execute(CREATE_BUSSTATS_SQL.format(schema='archive'))
+        add_source_column(connection, 'archive')
+        connection.execute(CREATE_INDEX_SQL.format(schema='archive'))
+
+    def downsample(self, until):
+        """Replaces the raw registers of the partitions older than until with their arrivals.
+
+        Arrivals are only computed for the months without any arrival saved, as update_arrivals
+        saves them while the registers are imported.
+
+        Args:
+            until (datetime.date): first day of the first month whose raw registers are kept.
+
+        Returns:
+            List[str]: months downsampled.
+        """
+        connection = self._connection()
+        downsampled = []
+
+        for month, (path, raw) in sorted(self.partitions().items()):
+            start = dt.datetime.strptime(month, '%Y-%m').date()
+            if not raw or start >= month_start(until):
+                continue
+
+            parameters = (str(start), str(month_start(start, 1)))
+            saved = connection.execute('select count(*) from arrivals where arrival_datetime >= ? '
+                                       'and arrival_datetime < ?', parameters).fetchone()[0]
+
+            if not saved and os.path.isfile(path):
+                self._save_arrivals(connection, path)
+
+            connection.execute('update partitions set raw=0 where month=?', (month,))
+            connection.commit()
+            if os.path.isfile(path):
+                POOL.discard(path, readonly=True)
+                os.remove(path)
+
+            self.logger.info('Downsampled %s', month)
+            downsampled.append(month)
+
+        return downsampled
+
+    def _save_arrivals(self, connection, path):
+        connection.execute('attach database ? as archive', (path,))
+        try:
+            rows = connection.execute('select line, actual_datetime, stop_id from '
+                                      'archive.busstats where delay_minutes=0 and source=? '
+                                      'order by actual_datetime', (DEFAULT_SOURCE,)).fetchall()
+        finally:
+            connection.execute('detach database archive')
+
+        grouper = OnlineGrouper(self.epsilon)
+        arrivals = []
+        for line, actual_datetime, stop_id in rows:
+            arrivals += grouper.add(BSRegister(line, actual_datetime), stop_id)
+        arrivals += grouper.flush(dt.datetime.max)
+
+        connection.executemany('insert or ignore into arrivals values (?, ?, ?)', [
+            (register.line, stop_id, register._datetime.strftime('%Y-%m-%d %H:%M:%S'))
+            for register, stop_id in arrivals])
+
+    def covering(self, start=None, end=None):
+        """Returns the paths of the raw partitions with registers between start and end.
+
+        Args:
+            start (datetime.date): first day. Default is the first day archived.
+            end (datetime.date): last day (included). Default is the last day archived.
+
+        Returns:
+            List[str]
+        """
+        return raw_partitions(self._connection(readonly=True), start, end)
+
+    def get_data(self, line, stop_id=833, start=None, end=None, source=DEFAULT_SOURCE):
+        """Gets the registers with delay 0 between two days, from the main database and the
+        partitions that cover the date range. Without a date range, only the main database is
+        read.
+
+        Args:
+            line (str | int | Iterable): bus line or lines to filter the data.
+            stop_id (int): bus stop identification to filter the data.
+            start (datetime.date): first day. Default is the first day saved.
+            end (datetime.date): last day (included). Default is the last day saved.
+            source (str): name of the source of the stop.
+
+        Returns:
+            Tuple[BSRegister]: registers sorted by datetime.
+        """
+        lines = normalize_lines(line)
+        condition = f'delay_minutes=0 and line in ({", ".join("?" * len(lines))}) and ' \
+                    'stop_id=? and source=?'
+        parameters = list(lines) + [int(stop_id), source]
+        if start is not None:
+            condition += ' and actual_datetime >= ?'
+            parameters.append(str(start))
+        if end is not None:
+            condition += ' and actual_datetime < ?'
+            parameters.append(str(end + dt.timedelta(days=1)))
+
+        rows = query_busstats(self._connection(readonly=True),
+                              f'select line, actual_datetime from {{schema}}.busstats '
+                              f'where {condition}', parameters, start, end,
+                              order_by='actual_datetime')
+
+        return tuple(BSRegister(*x) for x in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='BusStatsRetention')
+    parser.add_argument('-database', default=DATABASE_PATH)
+    parser.add_argument('-folder', help='folder of the partitions')
+    parser.add_argument('-hot', type=int, default=HOT_MONTHS, help='months kept in the database')
+    parser.add_argument('-raw', type=int, default=RAW_MONTHS, help='months of raw registers')
+    parser.add_argument('-cache', default=STATS_CACHE_PATH,
+                        help='npz file of the aggregated counts of delay_stats')
+    opt = parser.parse_args()
+
+    stats = DelayStats(opt.database, opt.cache)
+    archived, downsampled = Retention(opt.database, opt.folder, opt.hot, opt.raw).apply(
+        stats=stats)
+    print(f'Archived: {", ".join(archived) or "-"}')
+    print(f'Downsampled: {", ".join(downsampled) or "-"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of the last data read from each bus stop, shared between processes using a file."""
+
+import json
+import logging
+import time
+
+from atomic import atomic_write
+
+
+class SnapshotCache:
+    """Stores the last registers read from each bus stop with the time they were read.
+
+    The cache is a json file that is replaced atomically, so readers never see a partial write.
+
+    Args:
+        path (str): path of the json file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+
+    def load(self):
+        """Returns the content of the cache as a dict (stop id -> snapshot)."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.logger.warning('Corrupted snapshot cache %r, ignoring it', self.path)
+            return {}
+
+    def publish(self, stop_id, registers, timestamp=None):
+        """Saves the registers read from a bus stop.
+
+        Args:
+            stop_id (int): stop identification.
+            registers (Iterable[dict]): registers read from the stop.
+            timestamp (float): time when the registers were read. Default is now.
+        """
+        snapshots = self.load()
+        snapshots[str(stop_id)] = {
+            'timestamp': time.time() if timestamp is None else timestamp,
+            'registers': list(registers)
+        }
+
+        with atomic_write(self.path) as fh:
+            json.dump(snapshots, fh)
+
+    def age(self, stop_id):
+        """Returns the seconds since the stop was last read, or None if it is not cached."""
+        snapshot = self.load().get(str(stop_id))
+        if snapshot is None:
+            return None
+        return time.time() - snapshot['timestamp']
+
+    def get(self, stop_id, max_age):
+        """Returns the registers of a bus stop if they are fresh enough.
+
+        Args:
+            stop_id (int): stop identification.
+            max_age (int | float): maximum age of the snapshot in seconds.
+
+        Returns:
+            List[dict] | None: the cached registers, or None if the snapshot is missing or stale.
+        """
+        snapshot = self.load().get(str(stop_id))
+        if snapshot is None or time.time() - snapshot['timestamp'] > max_age:
+            return None
+        return snapshot['registers']
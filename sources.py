@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""Sources of bus stats: arrival boards of bus operators that can be parsed into registers.
+
+To add a source, subclass Source and decorate it with register_source. Every source shares the
+same fetch pipeline (downloader, rate limits and snapshot cache), storage and deduplication.
+"""
+
+import hashlib
+import importlib
+import os
+from dataclasses import dataclass
+from datetime import datetime
+
+from bs4 import BeautifulSoup as Soup
+
+SOURCES_ENV = 'BUSSTATS_SOURCES'
+DEFAULT_SOURCE = 'auvasa'
+
+
+@dataclass
+class Register:
+    """Represents a Bus Stat Register"""
+    line: str
+    actual_datetime: str
+    delay_minutes: int
+    stop_id: int
+    source: str = DEFAULT_SOURCE
+
+    def __post_init__(self):
+        self.line = str(self.line)
+        self.actual_datetime = str(self.actual_datetime)
+        self.delay_minutes = int(self.delay_minutes)
+        self.stop_id = int(self.stop_id)
+        self.source = str(self.source or DEFAULT_SOURCE)
+
+    @property
+    def id(self):
+        """Returns the id of a register made with sha1"""
+        return register_id(self.line, self.actual_datetime, self.stop_id, self.source)
+
+
+def register_id(line: str, actual_datetime: str, stop_id: int, source: str = DEFAULT_SOURCE):
+    """Returns the id of a register made with sha1, without creating the Register.
+
+    The source is only part of the id when it is not the default one, so the ids of the
+    registers saved before there were more sources do not change.
+    """
+    p = (line, actual_datetime, stop_id)
+    if source != DEFAULT_SOURCE:
+        p += (source,)
+    return hashlib.sha1(str(p).encode()).hexdigest()
+
+
+def parse_stop_page(content, stop_number: int):
+    """Extracts the registers from the html page of a bus stop.
+
+    Args:
+        content (bytes | str): html page of the bus stop.
+        stop_number (int): stop id of the page.
+
+    Returns:
+        Tuple[Register]
+    """
+    s = Soup(content, 'html.parser')
+    actual_datetime = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+
+    search = s.findAll('tr')
+    output = []
+
+    for item in search:
+        search2 = list(item.findAll('td'))
+        if search2 is None:
+            continue
+        if len(search2) == 0:
+            continue
+        t = [x.text for x in search2]
+        try:
+            if '+' in t[-1]:
+                t[-1] = 999
+            register = Register(t[0], actual_datetime, int(t[-1]), stop_number)
+        except ValueError:
+            continue
+
+        output.append(register)
+
+    return tuple(output)
+
+
+class Source:
+    """Arrival board of a bus operator.
+
+    Subclasses must set name and implement url and parse. The registers keep the name of their
+    source (set by busdatagenerator.fetch_stop), so the stop ids of different sources can
+    collide.
+    """
+    name = None
+
+    def url(self, stop_id):
+        """Returns the url of the page of a stop."""
+        raise NotImplementedError
+
+    def parse(self, content, stop_id):
+        """Extracts the registers from the page of a stop.
+
+        Args:
+            content (bytes): page of the stop.
+            stop_id (int): stop id of the page.
+
+        Returns:
+            Tuple[Register]
+        """
+        raise NotImplementedError
+
+    def cache_key(self, stop_id):
+        """Returns the key of the stop in the snapshot cache."""
+        return f'{self.name}:{stop_id}'
+
+
+SOURCES = {}
+
+
+def register_source(source_class):
+    """Class decorator that registers a source."""
+    SOURCES[source_class.name] = source_class()
+    return source_class
+
+
+def get_source(name=DEFAULT_SOURCE):
+    """Returns a registered source.
+
+    The modules listed in the environment variable BUSSTATS_SOURCES (comma separated) are
+    imported first, so they can register their sources.
+
+    Raises:
+        KeyError: if there is no source with that name.
+    """
+    if name not in SOURCES:
+        for module in os.environ.get(SOURCES_ENV, '').split(','):
+            if module.strip():
+                importlib.import_module(module.strip())
+
+    try:
+        return SOURCES[name]
+    except KeyError:
+        raise KeyError(f'Unknown source: {name!r}') from None
+
+
+@register_source
+class AuvasaSource(Source):
+    """Arrival board of AUVASA (Valladolid)."""
+    name = 'auvasa'
+
+    def url(self, stop_id):
+        return f'http://www.auvasa.es/parada.asp?codigo={stop_id}'
+
+    def parse(self, content, stop_id):
+        return parse_stop_page(content, stop_id)
+
+    def cache_key(self, stop_id):
+        return str(stop_id)
@@ -0,0 +1,72 @@
+import datetime as dt
+
+import matplotlib.dates as mdates
+import numpy as np
+import pytest
+
+from analysis import ChartJob, daily_times, load_arrivals, render_charts, to_arrays
+from sources import Register
+
+
+@pytest.fixture
+def database(make_database):
+    registers = [Register('2', '2019-02-04 08:37:00', 0, 833),
+                 Register('2', '2019-02-04 08:36:00', 1, 833),
+                 Register('2', '2019-02-04 08:35:00', 0, 833, 'other')]
+    return make_database(registers, [
+        ('2', 833, '2019-02-05 08:40:00'),
+        ('2', 833, '2019-02-04 08:38:00'),
+        ('2', 833, '2019-02-04 08:45:00'),
+        ('2', 833, '2019-02-04 12:00:00'),
+        ('8', 833, '2019-02-04 08:42:00'),
+        ('2', 686, '2019-02-04 08:30:00'),
+    ])
+
+
+def test_to_arrays():
+    arrays = to_arrays(['2019-02-04 08:30:00', dt.datetime(2019, 2, 5, 17, 15)])
+
+    assert arrays.datetimes.dtype == np.dtype('datetime64[m]')
+    assert arrays.hours.tolist() == [8.5, 17.25]
+    assert arrays.dates.tolist() == mdates.date2num([dt.datetime(2019, 2, 4),
+                                                     dt.datetime(2019, 2, 5)]).tolist()
+
+    assert len(to_arrays([]).hours) == 0
+
+
+def test_load_arrivals(database):
+    arrays = load_arrivals(2, path=database)
+    assert arrays.hours.tolist() == [8 + 38 / 60, 8.75, 12, 8 + 40 / 60]
+
+    arrays = load_arrivals((2, 8), path=database, time_window=(dt.time(8, 36), dt.time(8, 48)),
+                           end=dt.date(2019, 2, 4))
+    assert arrays.hours.tolist() == [8 + 38 / 60, 8.7, 8.75]
+
+    arrays = load_arrivals(2, path=database, start=dt.date(2019, 2, 5))
+    assert arrays.datetimes.tolist() == [dt.datetime(2019, 2, 5, 8, 40)]
+
+    arrays = load_arrivals(2, path=database, grouped=False)
+    assert arrays.datetimes.tolist() == [dt.datetime(2019, 2, 4, 8, 37)]
+
+
+def test_daily_times(database):
+    days = daily_times(load_arrivals(2, path=database))
+
+    assert [str(day) for day, _ in days] == ['2019-02-04', '2019-02-05']
+    assert [len(x) for _, x in days] == [3, 1]
+    assert daily_times(to_arrays([])) == []
+
+
+def test_render_charts(database, tmp_path):
+    jobs = [ChartJob(('2',)), ChartJob(('2', '8'), time_window=(dt.time(8, 36), dt.time(8, 48))),
+            ChartJob(('2',), 686)]
+
+    assert jobs[1].filename == 'stop-833-line-2-8-0836-0848.png'
+    assert ChartJob(('2',), start=dt.date(2019, 2, 4), end=dt.date(2019, 2, 5),
+                    grouped=False).filename == 'stop-833-line-2-from-20190204-to-20190205-raw.png'
+
+    outputs = render_charts(jobs, str(tmp_path / 'charts'), database, workers=2)
+    assert outputs == [str(tmp_path / 'charts' / x.filename) for x in jobs]
+    for output in outputs:
+        with open(output, 'rb') as fh:
+            assert fh.read(8) == b'\x89PNG\r\n\x1a\n'
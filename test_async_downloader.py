@@ -0,0 +1,100 @@
+import asyncio
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from async_downloader import AsyncDownloader
+from downloader import DownloaderError
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Closes the connection without answering the first failures requests, then answers the
+    path after waiting delay seconds."""
+    failures = 0
+    delay = 0
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(self.path)
+        if len(self.requests) <= self.failures:
+            self.close_connection = True
+            return
+
+        time.sleep(self.delay)
+        content = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.failures = 0
+    Handler.delay = 0
+    Handler.requests = []
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def download(*urls, retries=10):
+    async def run():
+        async with AsyncDownloader(retries=retries) as downloader:
+            return await asyncio.gather(*[downloader.get(url) for url in urls])
+
+    return asyncio.run(run())
+
+
+def test_retries(server, caplog):
+    Handler.failures = 2
+
+    response, = download(server + '/stop/833')
+    assert response.status_code == 200
+    assert response.text == '/stop/833'
+    assert len(Handler.requests) == 3
+
+    # aiohttp may resend a request by itself when a reused connection is closed, so the
+    # attempts are counted with the warnings of the downloader.
+    Handler.failures = 100
+    caplog.clear()
+    with pytest.raises(DownloaderError):
+        download(server + '/stop/833', retries=3)
+    assert [x.getMessage() for x in caplog.records if x.levelname == 'WARNING'] == [
+        f'Connection error in GET, retries={x}' for x in (2, 1, 0)]
+
+
+def test_max_retries():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    with pytest.raises(DownloaderError):
+        download(f'http://127.0.0.1:{port}/stop/833', retries=2)
+
+
+def test_coalescing(server):
+    Handler.delay = 0.2
+
+    first, second, other = download(server + '/stop/833', server + '/stop/833',
+                                    server + '/stop/686')
+    assert first is second
+    assert first.text == '/stop/833'
+    assert other.text == '/stop/686'
+    assert sorted(Handler.requests) == ['/stop/686', '/stop/833']
+
+    # Once the request has finished, the url is downloaded again.
+    Handler.delay = 0
+    download(server + '/stop/833')
+    assert sorted(Handler.requests) == ['/stop/686', '/stop/833', '/stop/833']
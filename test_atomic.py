@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from atomic import atomic_write
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / 'state.json')
+
+    with atomic_write(path) as fh:
+        fh.write('first')
+    with atomic_write(path, 'wb') as fh:
+        fh.write(b'second')
+
+    with open(path, encoding='utf-8') as fh:
+        assert fh.read() == 'second'
+
+    with pytest.raises(ValueError):
+        with atomic_write(path) as fh:
+            fh.write('partial')
+            raise ValueError
+
+    with open(path, encoding='utf-8') as fh:
+        assert fh.read() == 'second'
+    assert os.listdir(str(tmp_path)) == ['state.json']
@@ -0,0 +1,69 @@
+import os
+import stat
+from datetime import date, timedelta
+
+import pytest
+
+import auth
+from auth import SecretNotFoundError, TokenVerifier, create_token, get_secret
+
+SECRET = b'peter friend'
+
+
+def test_create_token():
+    token = create_token(SECRET, date(2019, 2, 4))
+
+    assert token.startswith('2019-02-04.')
+    assert len(token) == 75
+    assert token == create_token(SECRET, date(2019, 2, 4))
+    assert token != create_token(b'other secret', date(2019, 2, 4))
+
+
+def test_token_verifier():
+    verifier = TokenVerifier(SECRET, max_failures=3)
+    today = date.today()
+
+    assert verifier.verify(create_token(SECRET, today), '127.0.0.1') is True
+    assert verifier.verify(create_token(SECRET, today), '127.0.0.1') is True
+
+    assert verifier.verify(create_token(SECRET, today - timedelta(days=1)), '1.1.1.1') is False
+    assert verifier.verify(create_token(b'other secret', today), '1.1.1.1') is False
+    assert verifier.verify('(2019, 2, 4)', '1.1.1.1') is False
+    assert verifier.verify(None, '1.1.1.1') is False
+
+    assert verifier.is_blocked('1.1.1.1') is True
+    assert verifier.is_blocked('127.0.0.1') is False
+
+
+def test_get_secret(tmp_path, monkeypatch):
+    monkeypatch.delenv(auth.SECRET_ENV, raising=False)
+    monkeypatch.setattr(auth, 'SECRET_PATH', str(tmp_path / 'busstats.key'))
+
+    with pytest.raises(SecretNotFoundError):
+        create_token()
+    assert not os.path.exists(auth.SECRET_PATH)
+
+    secret = get_secret(create=True)
+    assert len(secret) == 64
+    assert get_secret() == secret
+    assert TokenVerifier().verify(create_token()) is True
+    if os.name == 'posix':
+        assert stat.S_IMODE(os.stat(auth.SECRET_PATH).st_mode) == 0o600
+
+    monkeypatch.setenv(auth.SECRET_ENV, 'peter friend')
+    assert get_secret() == b'peter friend'
+
+
+def test_token_verifier_prune(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, 'monotonic', lambda: now[0])
+    verifier = TokenVerifier(SECRET, window=60)
+
+    for i in range(100):
+        assert verifier.verify('invalid', f'10.0.0.{i}') is False
+    assert len(verifier._failures) == 100
+
+    # The failures of every client expire, not only the ones of the clients that come back.
+    now[0] += 61
+    assert verifier.verify('invalid', '1.1.1.1') is False
+    assert list(verifier._failures) == ['1.1.1.1']
@@ -0,0 +1,85 @@
+import datetime as dt
+import os
+import sqlite3
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from columnar import export_tables, import_tables
+from retention import Retention
+from sources import Register
+
+REGISTERS = [Register('2', '2019-01-04 08:00:00', 0, 833),
+             Register('2', '2019-02-04 08:00:00', 3, 833),
+             Register('8', '2019-02-04 08:01:00', 999, 686),
+             Register('C1', '2019-02-05 23:59:00', 12, 833, 'other')]
+
+
+@pytest.fixture
+def database(make_database, tmp_path):
+    os.makedirs(str(tmp_path / 'source'))
+    return make_database(REGISTERS, [('2', 833, '2019-02-04 08:02:00')],
+                         tmp_path / 'source' / 'busstats.sqlite')
+
+
+def test_export_import(database, tmp_path):
+    # January is moved to a partition, which must be exported too.
+    Retention(database).archive(dt.date(2019, 2, 1))
+
+    folder = str(tmp_path / 'export')
+    assert export_tables(folder, database) == {'busstats': 4, 'arrivals': 1}
+    assert sorted(os.listdir(os.path.join(folder, 'busstats'))) == [
+        'date=2019-01-04', 'date=2019-02-04', 'date=2019-02-05']
+
+    table = pq.read_table(os.path.join(folder, 'busstats', 'date=2019-02-04', 'part-0.parquet'))
+    assert table.num_rows == 2
+    assert pa.types.is_dictionary(table.schema.field('line').type)
+    assert pa.types.is_timestamp(table.schema.field('actual_datetime').type)
+    assert table.column('delay_minutes').to_pylist() == [3, 999]
+
+    destination = str(tmp_path / 'destination.sqlite')
+    assert import_tables(folder, destination) == {'busstats': 4, 'arrivals': 1}
+    assert import_tables(folder, destination) == {'busstats': 0, 'arrivals': 0}
+
+    with sqlite3.connect(destination) as connection:
+        rows = connection.execute('select * from busstats order by actual_datetime').fetchall()
+        arrivals = connection.execute('select * from arrivals').fetchall()
+    assert rows == [(x.id, x.line, x.actual_datetime, x.delay_minutes, x.stop_id, x.source)
+                    for x in REGISTERS]
+    assert arrivals == [('2', 833, '2019-02-04 08:02:00')]
+
+
+def test_export_range(database, tmp_path):
+    folder = str(tmp_path / 'export')
+    result = export_tables(folder, database, dt.date(2019, 2, 5), dt.date(2019, 2, 5))
+
+    assert result == {'busstats': 1, 'arrivals': 0}
+    assert os.listdir(os.path.join(folder, 'busstats')) == ['date=2019-02-05']
+
+
+def test_import_archived(database, make_database, tmp_path, caplog):
+    folder = str(tmp_path / 'export')
+    export_tables(folder, database)
+
+    # January is archived in the destination, so its register is saved in the partition.
+    os.makedirs(str(tmp_path / 'archived'))
+    destination = make_database([Register('2', '2019-01-10 08:00:00', 0, 833)], (),
+                                tmp_path / 'archived' / 'busstats.sqlite')
+    retention = Retention(destination)
+    retention.archive(dt.date(2019, 2, 1))
+
+    assert import_tables(folder, destination) == {'busstats': 4, 'arrivals': 1}
+    registers = retention.get_data(2, start=dt.date(2019, 1, 1), end=dt.date(2019, 1, 31))
+    assert [str(x.date) for x in registers] == ['2019-01-04', '2019-01-10']
+
+    # Once downsampled, the registers of January are skipped with a warning.
+    os.makedirs(str(tmp_path / 'downsampled'))
+    destination = make_database([Register('2', '2019-01-10 08:00:00', 0, 833)], (),
+                                tmp_path / 'downsampled' / 'busstats.sqlite')
+    retention = Retention(destination)
+    retention.archive(dt.date(2019, 2, 1))
+    retention.downsample(dt.date(2019, 2, 1))
+
+    assert import_tables(folder, destination) == {'busstats': 3, 'arrivals': 1}
+    assert '1 rows of busstats were not imported' in caplog.text
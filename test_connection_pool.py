@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from connection_pool import ConnectionPool
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool()
+    yield pool
+    pool.close_all()
+
+
+def test_connection_reuse(pool, make_database):
+    path = make_database()
+
+    connection = pool.get(path)
+    assert pool.get(path) is connection
+    readonly = pool.get(path, readonly=True)
+    assert readonly is not connection
+    assert pool.get(path, readonly=True) is readonly
+
+    with pytest.raises(sqlite3.OperationalError):
+        readonly.execute('delete from busstats')
+
+    # Other threads get their own connections.
+    other = []
+    thread = threading.Thread(target=lambda: other.append(pool.get(path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not connection
+
+    pool.discard(path)
+    assert pool.get(path) is not connection
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is not available')
+def test_fork(pool, make_database):
+    path = make_database()
+    connection = pool.get(path)
+
+    pid = os.fork()
+    if pid == 0:
+        # The child opens its own connection instead of using the one of the parent.
+        child = pool.get(path)
+        os._exit(0 if child is not connection and pool.get(path) is child else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert pool.get(path) is connection
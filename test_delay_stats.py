@@ -0,0 +1,109 @@
+import datetime as dt
+import sqlite3
+
+import numpy as np
+import pytest
+
+from delay_stats import DelayStats
+from retention import Retention
+from sources import Register
+
+DELAYS = [0, 1, 1, 2, 3, 5, 7, 8, 12, 20, 999]
+
+
+@pytest.fixture
+def database(make_database):
+    registers = []
+    for i, delay in enumerate(DELAYS):
+        # 2019-02-04 is a monday and 2019-02-05 a tuesday.
+        registers.append(Register('2', f'2019-02-04 08:{i:02d}:00', delay, 833))
+        registers.append(Register('8', f'2019-02-05 09:{i:02d}:00',
+                                  delay * 2 if delay != 999 else delay, 833))
+    # Registers of other sources are not aggregated.
+    registers.append(Register('2', '2019-02-04 08:30:00', 40, 833, 'other'))
+
+    return make_database(registers, [
+        ('2', 833, '2019-02-04 08:38:00'), ('2', 833, '2019-02-05 08:44:00'),
+        ('2', 833, '2019-02-06 08:41:00')])
+
+
+def test_summary(database):
+    stats = DelayStats(database)
+    rows = stats.summary(by=('line', 'weekday'), on_time=5)
+
+    assert [(x['line'], x['weekday'], x['count']) for x in rows] == [('2', 0, 10), ('8', 1, 10)]
+
+    expected = np.array(DELAYS[:-1])
+    for row, factor in zip(rows, (1, 2)):
+        for q in (50, 90, 99):
+            assert row[f'p{q}'] == pytest.approx(np.percentile(expected * factor, q))
+
+    assert rows[0]['histogram'] == [1, 3, 1, 3, 1, 0, 1, 0, 0]
+    assert rows[0]['on_time'] == 0.6
+    assert rows[1]['on_time'] == 0.4
+
+    rows = stats.summary(by=(), start=dt.date(2019, 2, 5))
+    assert len(rows) == 1 and rows[0]['count'] == 10
+
+    assert stats.summary(by=('hour',), end=dt.date(2019, 2, 1)) == []
+
+    with pytest.raises(ValueError):
+        stats.summary(by=('minute',))
+    with pytest.raises(ValueError):
+        stats.summary('speed')
+
+
+def test_summary_arrivals(database):
+    rows = DelayStats(database).summary('arrival', on_time=8.7)
+
+    assert len(rows) == 1
+    assert rows[0]['count'] == 3
+    assert rows[0]['p50'] == pytest.approx(8 + 41 / 60)
+    assert rows[0]['histogram'][8] == 3
+    assert rows[0]['on_time'] == pytest.approx(2 / 3)
+
+
+def test_refresh_and_cache(database, tmp_path):
+    cache_path = str(tmp_path / 'stats.npz')
+    stats = DelayStats(database, cache_path)
+
+    assert stats.refresh() > 0
+    assert stats.refresh() == 0
+
+    connection = sqlite3.connect(database)
+    connection.execute("insert into busstats values ('d', '2', '2019-02-07 08:00:00', 4, 833, "
+                       "'auvasa')")
+    connection.commit()
+    connection.close()
+
+    cached = DelayStats(database, cache_path)
+    assert cached.summary(refresh=False)[0]['count'] == 10
+    assert cached.refresh() == 1
+    assert cached.summary(refresh=False)[0]['count'] == 11
+    assert cached.summary() == stats.summary()
+
+    with open(cache_path, 'wb') as fh:
+        fh.write(b'corrupted')
+    assert DelayStats(database, cache_path).summary()[0]['count'] == 11
+
+
+def test_archive(database, tmp_path):
+    stats = DelayStats(database, str(tmp_path / 'stats.npz'))
+    assert Retention(database).archive(dt.date(2019, 3, 1), stats) == ['2019-02']
+
+    # Every register has been archived, so sqlite reuses the rowids.
+    connection = sqlite3.connect(database)
+    connection.execute("insert into busstats values ('d', '2', '2019-03-07 08:00:00', 4, 833, "
+                       "'auvasa')")
+    assert connection.execute('select rowid from busstats').fetchall() == [(1,)]
+    connection.commit()
+    connection.close()
+
+    assert [x['count'] for x in stats.summary()] == [11, 10]
+    assert DelayStats(database, str(tmp_path / 'stats.npz')).summary() == stats.summary()
+
+    # Without the cache, the counts of the archived months are read from the partitions.
+    summary = stats.summary()
+    assert DelayStats(database).summary() == summary
+    stats.reset()
+    assert stats.summary() == summary
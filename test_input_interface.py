@@ -4,11 +4,42 @@ from sqlite3 import OperationalError
 
 import pytest
 
-from input_interface import BSRegister, DBConnection
+from connection_pool import POOL
+from input_interface import BSRegister, DBConnection, normalize_lines
+from sources import Register
 
 DATABASE_PATH = 'D:/.database/sql/busstats.sqlite'
 
 
+def test_normalize_lines():
+    assert normalize_lines(2) == ('2',)
+    assert normalize_lines('C1') == ('C1',)
+    assert normalize_lines([2, 'C1']) == ('2', 'C1')
+
+
+def test_db_connection_shared(make_database):
+    path = make_database([Register('2', '2019-02-04 08:00:00', 0, 833)])
+    holder = POOL.get(path)
+    holder.execute("insert into arrivals values ('2', 833, '2019-02-04 08:00:00')")
+
+    # The connection and the transaction of the other holder survive the DBConnection.
+    with pytest.raises(ValueError):
+        with DBConnection(path) as c:
+            assert len(c.get_data(2)) == 1
+            raise ValueError
+    with DBConnection(path) as c:
+        assert len(c.get_data(2)) == 1
+
+    assert holder.in_transaction
+    holder.rollback()
+
+    with pytest.raises(ValueError):
+        with DBConnection(path) as c:
+            c.cur.execute("insert into arrivals values ('8', 833, '2019-02-04 08:00:00')")
+            raise ValueError
+    assert holder.execute('select count(*) from arrivals').fetchone()[0] == 0
+
+
 def test_dbregister():
     one_day = dt.datetime(2019, 2, 4, 12, 15, 3)
     other = one_day.replace(hour=one_day.hour - 1, minute=one_day.minute + 1)
@@ -44,6 +75,7 @@ def test_db_connection():
         with DBConnection(path='peter.class') as c:
             (c.get_data(9))
 
+    POOL.discard('peter.class')
     os.remove('peter.class')
 
     with DBConnection() as c:
@@ -0,0 +1,34 @@
+from metrics import Metrics
+
+
+def test_metrics():
+    metrics = Metrics(enabled=True)
+
+    with metrics.timer('fetch'):
+        pass
+    metrics.observe('fetch', 2.0)
+    metrics.increment('fetched_bytes', 1024)
+    metrics.increment('download_retries')
+
+    summary = metrics.summary()
+    assert 'fetch: 2 calls' in summary
+    assert 'fetched_bytes: 1024' in summary
+
+    text = metrics.prometheus()
+    assert 'busstats_fetch_seconds_count 2\n' in text
+    assert 'busstats_fetch_seconds_max 2.000000\n' in text
+    assert 'busstats_download_retries_total 1\n' in text
+
+    metrics.reset()
+    assert metrics.summary() == ''
+
+
+def test_metrics_disabled():
+    metrics = Metrics(enabled=False)
+
+    with metrics.timer('fetch'):
+        pass
+    metrics.increment('fetched_bytes', 1024)
+
+    assert metrics.summary() == ''
+    assert metrics.prometheus() == '\n'
@@ -0,0 +1,45 @@
+import datetime as dt
+
+from input_interface import BSRegister
+from online_grouping import OnlineGrouper
+
+
+def _register(line, hour, minute):
+    return BSRegister(line, dt.datetime(2019, 2, 4, hour, minute))
+
+
+def test_online_grouper():
+    grouper = OnlineGrouper(epsilon=2)
+
+    assert grouper.add(_register(2, 8, 30), 833) == []
+    assert grouper.add(_register(2, 8, 31), 833) == []
+    assert grouper.add(_register(8, 8, 31), 833) == []
+    assert grouper.add(_register(2, 8, 31), 686) == []
+    assert len(grouper) == 3
+
+    closed = grouper.add(_register(2, 8, 32), 833)
+    assert closed == [(_register(2, 8, 31), 833)]
+    assert len(grouper) == 3
+
+    closed = grouper.add(_register(8, 8, 40), 833)
+    assert sorted(closed, key=lambda x: (x[0].line, x[1])) == [
+        (_register(2, 8, 31), 686), (_register(2, 8, 32), 833), (_register(8, 8, 31), 833)]
+    assert len(grouper) == 1
+
+    assert grouper.add(_register(2, 8, 10), 833) == []
+    assert grouper.flush(dt.datetime(2019, 2, 4, 9, 0)) == [(_register(8, 8, 40), 833)]
+    assert grouper.flush() == []
+
+
+def test_online_grouper_state(tmp_path):
+    path = str(tmp_path / 'grouper.json')
+
+    grouper = OnlineGrouper(epsilon=2, selector=min, state_path=path)
+    grouper.add(_register(2, 8, 30), 833)
+    grouper.add(_register(2, 8, 31), 833)
+    grouper.save()
+
+    grouper = OnlineGrouper(epsilon=2, selector=min, state_path=path)
+    assert len(grouper) == 1
+    assert grouper.watermark == dt.datetime(2019, 2, 4, 8, 31)
+    assert grouper.add(_register(2, 8, 45), 833) == [(_register(2, 8, 30), 833)]
@@ -0,0 +1,50 @@
+import os
+import pstats
+import time
+
+import pytest
+
+from profiling import profile
+
+
+def busy(seconds):
+    t0 = time.time()
+    while time.time() - t0 < seconds:
+        sum(range(1000))
+
+
+def test_profile_cprofile(tmp_path):
+    with profile('cprofile', str(tmp_path), 'run'):
+        busy(0.05)
+
+    files = os.listdir(str(tmp_path))
+    assert len(files) == 1
+    assert files[0].startswith('run-') and files[0].endswith('.pstats')
+
+    stats = pstats.Stats(str(tmp_path / files[0]))
+    assert any(function == 'busy' for _, _, function in stats.stats)
+
+
+def test_profile_sample(tmp_path):
+    with profile('sample', str(tmp_path), 'run'):
+        busy(0.2)
+
+    files = os.listdir(str(tmp_path))
+    assert len(files) == 1
+    assert files[0].startswith('run-') and files[0].endswith('.collapsed')
+
+    with open(str(tmp_path / files[0]), encoding='utf-8') as fh:
+        lines = fh.read().splitlines()
+    assert lines
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+    assert any('test_profiling:busy:' in line for line in lines)
+
+
+def test_profile_disabled(tmp_path):
+    with profile(None, str(tmp_path), 'run'):
+        busy(0.01)
+    assert os.listdir(str(tmp_path)) == []
+
+    with pytest.raises(ValueError):
+        with profile('other', str(tmp_path), 'run'):
+            pass
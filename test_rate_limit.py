@@ -0,0 +1,23 @@
+from rate_limit import HostRateLimiter, TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.05 < bucket.reserve() <= 0.1
+    assert 0.15 < bucket.reserve() <= 0.2
+
+
+def test_host_rate_limiter():
+    limiter = HostRateLimiter(rate=1, capacity=1, hosts={'www.auvasa.es': (10, 3)})
+
+    auvasa = limiter.bucket('http://www.auvasa.es/parada.asp?codigo=833')
+    assert auvasa is limiter.bucket('http://www.auvasa.es/parada.asp?codigo=686')
+    assert (auvasa.rate, auvasa.capacity) == (10, 3)
+
+    other = limiter.bucket('http://localhost:5415/')
+    assert other is not auvasa
+    assert (other.rate, other.capacity) == (1, 1)
+    assert limiter.acquire('http://localhost:5415/') == 0
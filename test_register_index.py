@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from register_index import RegisterIndex
+
+
+def _now(minutes=0):
+    return (datetime.today() + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_register_index(tmp_path):
+    path = tmp_path / 'busstats.csv'
+    content = 'line,actual_datetime,delay_minutes,stop_id\n'
+    content += f'2,{_now(-10)},5,833\n8,{_now(-10)},7,833\n'
+    path.write_text(content)
+
+    index = RegisterIndex(str(path))
+    assert index.refresh() == 2
+    assert index.refresh() == 0
+
+    content += f'2,{_now(-5)},0,833\n2,{_now(-5)},3,686\n8,{_now()},2,833\n2,{_now()},9,833\n'
+    path.write_text(content)
+    assert index.refresh() == 4
+    assert len(index) == 6
+
+    latest = index.latest(833)
+    assert {x.line: x.delay_minutes for x in latest} == {'8': 2, '2': 9}
+    assert index.latest(1) == []
+
+    assert [x.delay_minutes for x in index.delays(2)] == [5, 0, 3, 9]
+    assert [x.delay_minutes for x in index.delays('2', stop_id=833)] == [5, 0, 9]
+    assert [x.delay_minutes for x in index.delays(2, start=_now(-6))] == [0, 3, 9]
+    assert [x.delay_minutes for x in index.delays(2, end=_now(-6))] == [5]
+    assert index.delays(5) == []
+
+    path.unlink()
+    assert index.refresh() == 0
+    assert len(index) == 6
+
+    path.write_text('line,actual_datetime,delay_minutes,stop_id\n' + f'8,{_now(1)},1,833\n')
+    assert index.refresh() == 1
+    assert {x.line: x.delay_minutes for x in index.latest(833)} == {'8': 1}
+
+
+def test_register_index_prune(tmp_path):
+    path = tmp_path / 'busstats.csv'
+    path.write_text('line,actual_datetime,delay_minutes,stop_id\n'
+                    f'2,{_now(-120)},5,833\n2,{_now()},4,833\n')
+
+    index = RegisterIndex(str(path), max_age=timedelta(hours=1))
+    index.refresh()
+
+    assert len(index) == 1
+    assert [x.delay_minutes for x in index.delays(2)] == [4]
+
+
+def test_register_index_sources(tmp_path):
+    path = tmp_path / 'busstats.csv'
+    now = _now()
+    path.write_text('line,actual_datetime,delay_minutes,stop_id,source\n'
+                    f'2,{now},5,833,auvasa\n2,{now},8,833,other\n8,{now},1,833,\n')
+
+    index = RegisterIndex(str(path))
+    assert index.refresh() == 3
+
+    assert {x.line: x.delay_minutes for x in index.latest(833)} == {'2': 5, '8': 1}
+    assert {x.line: x.delay_minutes for x in index.latest(833, 'other')} == {'2': 8}
+    assert [x.delay_minutes for x in index.delays(2)] == [5]
+    assert [x.delay_minutes for x in index.delays(2, stop_id=833, source='other')] == [8]
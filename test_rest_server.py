@@ -5,8 +5,8 @@ from datetime import datetime
 
 import requests
 from rpi.custom_logging import get_dict_config
-from rpi.encryption import encrypt
 
+from auth import create_token, get_secret
 from rest_server import get_server, SOURCE_CSV, LOG_PATH
 
 config = get_dict_config(name='')
@@ -27,16 +27,16 @@ def _simulate_csv():
         f.write('peter friend')
 
 
-def _create_token():
-    today = datetime.today()
-    anything = (today.year, today.month, today.day)
-
-    token = encrypt(repr(anything))
-    return token
+def _simulate_registers():
+    now = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    with open(SOURCE_CSV, 'w') as f:
+        f.write(f'line,actual_datetime,delay_minutes,stop_id\n2,{now},5,833\n8,{now},3,833\n')
+    return now
 
 
 def test_server():
-    token = _create_token()
+    get_secret(create=True)
+    token = create_token()
     server = get_server()
 
     t = threading.Thread(target=_run_server_with_threading, args=(server,), name='RestServer',
@@ -67,6 +67,26 @@ def test_server():
     r = requests.delete('http://127.0.0.1:5415', data={'token': token})
     assert r.text == 'Result: False'
 
+    now = _simulate_registers()
+    r = requests.get('http://127.0.0.1:5415/stops/833/latest')
+    assert r.json() == {'stop_id': 833, 'actual_datetime': now, 'lines': {'2': 5, '8': 3}}
+
+    r = requests.get('http://127.0.0.1:5415/stops/1/latest')
+    assert r.status_code == 404
+
+    r = requests.get('http://127.0.0.1:5415/lines/2/delays', params={'from': now[:10]})
+    assert r.json()['registers'] == [
+        {'actual_datetime': now, 'delay_minutes': 5, 'stop_id': 833}]
+
+    r = requests.get('http://127.0.0.1:5415/lines/2/delays', params={'to': 'yesterday'})
+    assert r.status_code == 400
+
+    os.remove(SOURCE_CSV)
+
+    r = requests.get('http://127.0.0.1:5415/metrics')
+    assert r.status_code == 200
+    assert 'busstats_serve_seconds_count' in r.text
+
     r = requests.get('http://127.0.0.1:5415/favicon.ico')
     assert r.headers['Content-type'] == 'image/png'
     assert len(r.content) > 0
@@ -0,0 +1,122 @@
+import datetime as dt
+import os
+import sqlite3
+
+import pytest
+
+import input_interface
+from analysis import load_arrivals
+from data_mangement import DataManager
+from retention import ArchiveError, Retention, month_start
+from sources import Register
+
+
+@pytest.fixture
+def database(make_database):
+    registers = []
+    for month in range(1, 7):
+        for minute, delay in ((0, 1), (1, 0), (2, 0), (30, 0)):
+            registers.append(Register('2', f'2019-{month:02d}-04 08:{minute:02d}:00', delay, 833))
+
+    return make_database(registers, [('2', 833, '2019-02-04 08:02:00')])
+
+
+def test_month_start():
+    assert month_start(dt.date(2019, 2, 14)) == dt.date(2019, 2, 1)
+    assert month_start(dt.date(2019, 2, 14), -2) == dt.date(2018, 12, 1)
+    assert month_start(dt.date(2019, 12, 31), 1) == dt.date(2020, 1, 1)
+
+
+def test_retention(database, tmp_path):
+    retention = Retention(database, hot_months=2, raw_months=4)
+    assert retention.archived_until() is None
+    assert len(retention.get_data(2)) == 18
+
+    archived, downsampled = retention.apply(dt.date(2019, 6, 20))
+    assert archived == ['2019-01', '2019-02', '2019-03', '2019-04']
+    assert downsampled == ['2019-01', '2019-02']
+    assert retention.archived_until() == dt.date(2019, 5, 1)
+
+    assert sorted(os.listdir(tmp_path)) == ['busstats-2019-03.sqlite',
+                                            'busstats-2019-04.sqlite', 'busstats.sqlite']
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('select count(*) from busstats').fetchone()[0] == 8
+        arrivals = connection.execute('select arrival_datetime from arrivals '
+                                      'order by arrival_datetime').fetchall()
+    # February already had arrivals, so it is not grouped again.
+    assert [x[0] for x in arrivals] == ['2019-01-04 08:02:00', '2019-01-04 08:30:00',
+                                        '2019-02-04 08:02:00']
+
+    assert len(retention.get_data(2)) == 6
+    assert len(retention.get_data(2, end=dt.date(2019, 6, 30))) == 12
+    registers = retention.get_data(2, start=dt.date(2019, 4, 1), end=dt.date(2019, 5, 4))
+    assert [str(x.date) for x in registers] == ['2019-04-04'] * 3 + ['2019-05-04'] * 3
+    assert retention.covering(dt.date(2019, 4, 1), dt.date(2019, 5, 4)) == [
+        str(tmp_path / 'busstats-2019-04.sqlite')]
+
+    assert retention.apply(dt.date(2019, 6, 21)) == ([], [])
+    assert retention.apply(dt.date(2019, 7, 1)) == (['2019-05'], ['2019-03'])
+
+
+def test_insert_archived(database, tmp_path):
+    retention = Retention(database, hot_months=2, raw_months=4)
+    retention.apply(dt.date(2019, 6, 20))
+
+    registers = [Register('2', '2019-01-04 09:00:00', 0, 833),  # downsampled
+                 Register('2', '2019-03-04 08:01:00', 0, 833),  # already saved
+                 Register('2', '2019-03-04 09:00:00', 0, 833),
+                 Register('2', '2019-04-04 09:00:00', 0, 833)]
+    assert retention.insert_archived(registers) == (2, 1)
+    assert retention.insert_archived(registers) == (0, 1)
+
+    registers = retention.get_data(2, start=dt.date(2019, 3, 1), end=dt.date(2019, 4, 30))
+    assert [str(x.time) for x in registers] == ['08:01:00', '08:02:00', '08:30:00', '09:00:00'] * 2
+
+
+def test_archive_missing(database, tmp_path):
+    # The partition of january rejects the registers with delay 1, so they are not copied.
+    with sqlite3.connect(str(tmp_path / 'busstats-2019-01.sqlite')) as connection:
+        connection.execute('create table busstats (id varchar primary key, line varchar, '
+                           'actual_datetime varchar, delay_minutes integer check '
+                           '(delay_minutes = 0), stop_id integer, source varchar)')
+
+    retention = Retention(database)
+    with pytest.raises(ArchiveError):
+        retention.archive(dt.date(2019, 2, 1))
+
+    assert retention.partitions() == {}
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('select count(*) from busstats').fetchone()[0] == 24
+
+
+def test_archived_data(database, monkeypatch):
+    monkeypatch.setattr(input_interface, 'DATABASE_PATH', database)
+    Retention(database).archive(dt.date(2019, 5, 1))
+
+    # Without a date range, only the hot months are read.
+    data = DataManager(2)
+    assert [str(x.date) for x in data[::3]] == ['2019-05-04', '2019-06-04']
+    assert len(DataManager(2, n=4)) == 4
+    assert len(load_arrivals(2, grouped=False).datetimes) == 6
+    assert len(load_arrivals(2, start=dt.date(2019, 4, 1), grouped=False).datetimes) == 9
+    assert len(load_arrivals(2, end=dt.date(2019, 6, 30), grouped=False).datetimes) == 18
+
+
+def test_many_partitions(make_database):
+    # More partitions than sqlite can attach at once.
+    database = make_database([Register('2', f'{year}-{month:02d}-04 08:00:00', 0, 833)
+                              for year in (2018, 2019) for month in range(1, 13)])
+    retention = Retention(database)
+    assert len(retention.archive(dt.date(2019, 12, 1))) == 23
+
+    registers = retention.get_data(2, start=dt.date(2018, 1, 1), end=dt.date(2019, 12, 31))
+    assert [str(x.date)[:7] for x in registers] == [
+        f'{year}-{month:02d}' for year in (2018, 2019) for month in range(1, 13)]
+
+
+def test_retention_invalid():
+    with pytest.raises(ValueError):
+        Retention('busstats.sqlite', hot_months=3, raw_months=2)
+    with pytest.raises(ValueError):
+        Retention('busstats.sqlite', hot_months=1, raw_months=13)
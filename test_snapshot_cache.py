@@ -0,0 +1,32 @@
+import time
+
+from snapshot_cache import SnapshotCache
+
+
+def test_snapshot_cache(tmp_path):
+    cache = SnapshotCache(str(tmp_path / 'snapshots.json'))
+    register = {'line': '2', 'actual_datetime': '2019-02-04 12:15:03', 'delay_minutes': 5,
+                'stop_id': 833}
+
+    assert cache.get(833, 60) is None
+    assert cache.age(833) is None
+
+    cache.publish(833, [register])
+    cache.publish(686, [], timestamp=time.time() - 120)
+
+    assert cache.get(833, 60) == [register]
+    assert cache.age(833) < 60
+    assert cache.get(686, 60) is None
+    assert cache.get(686, 180) == []
+    assert list(tmp_path.iterdir()) == [tmp_path / 'snapshots.json']
+
+
+def test_snapshot_cache_corrupted(tmp_path):
+    path = tmp_path / 'snapshots.json'
+    path.write_text('{"833": ')
+
+    cache = SnapshotCache(str(path))
+    assert cache.get(833, 60) is None
+
+    cache.publish(833, [])
+    assert cache.get(833, 60) == []
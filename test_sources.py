@@ -0,0 +1,55 @@
+import hashlib
+import os
+
+import pytest
+
+from sources import AuvasaSource, Register, SOURCES, Source, get_source, register_source
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'parada_833.html')
+
+
+def test_auvasa_source():
+    source = get_source('auvasa')
+
+    with open(FIXTURE_PATH, 'rb') as fh:
+        registers = source.parse(fh.read(), 833)
+
+    assert isinstance(source, AuvasaSource)
+    assert source.url(833) == 'http://www.auvasa.es/parada.asp?codigo=833'
+    assert source.cache_key(833) == '833'
+    assert [x.line for x in registers] == ['2', '8', '10', '13', '14', '17', '18', 'C1']
+    assert [x.delay_minutes for x in registers] == [3, 0, 7, 12, 5, 21, 999, 9]
+    assert {x.stop_id for x in registers} == {833}
+    assert len({x.actual_datetime for x in registers}) == 1
+
+
+def test_register_id():
+    register = Register('2', '2019-02-04 12:15:03', 0, 833)
+    other = Register('2', '2019-02-04 12:15:03', 0, 833, 'fake')
+
+    assert register.source == 'auvasa'
+    assert register.id == hashlib.sha1(b"('2', '2019-02-04 12:15:03', 833)").hexdigest()
+    assert other.id != register.id
+
+
+def test_register_source():
+    @register_source
+    class FakeSource(Source):
+        name = 'fake'
+
+        def url(self, stop_id):
+            return f'http://localhost/{stop_id}'
+
+        def parse(self, content, stop_id):
+            return [Register(line, '2019-02-04 12:15:03', 0, stop_id)
+                    for line in content.decode().split()]
+
+    try:
+        source = get_source('fake')
+        assert source.cache_key(1) == 'fake:1'
+        assert [x.line for x in source.parse(b'1 2', 1)] == ['1', '2']
+    finally:
+        del SOURCES['fake']
+
+    with pytest.raises(KeyError):
+        get_source('fake')
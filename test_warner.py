@@ -0,0 +1,52 @@
+import json
+
+import warner
+from sources import Register
+from warner import Watcher
+
+
+def test_watcher_poll(tmp_path, monkeypatch):
+    path = tmp_path / 'subscriptions.json'
+    path.write_text(json.dumps([{'user': 'ana', 'stop_id': 833, 'line': '2', 'lead_time': 5},
+                                {'user': 'ana', 'stop_id': 686, 'line': '8', 'lead_time': 3}]),
+                    encoding='utf-8')
+
+    # Delays of each poll, by stop. Line 8 never gets close enough to be notified.
+    polls = iter([{833: [('2', 8)], 686: [('8', 10)]},
+                  {833: [('2', 9), ('2', 5)], 686: [('8', 7)]},
+                  {833: [('2', 3)], 686: [('8', 6)]},
+                  {833: [('2', 6)], 686: []},
+                  {833: [('2', 4)], 686: []},
+                  {833: [], 686: []},
+                  {833: [('2', 2)], 686: []}])
+    analysed = []
+
+    def analyse_stops(stops, max_age=None):
+        analysed.append(stops)
+        delays = next(polls)
+        return [[Register(line, '2019-02-04 12:00:00', delay, stop_id)
+                 for line, delay in delays[stop_id]] for stop_id, _ in stops]
+
+    monkeypatch.setattr(warner, 'analyse_stops', analyse_stops)
+    watcher = Watcher(str(path))
+
+    assert watcher.poll() == {}
+    assert analysed == [[(686, None), (833, None)]]
+
+    # The first delay within the lead time is notified, the following ones are not.
+    assert watcher.poll() == {'ana': ['2 llegará a las 12:05 (5 mins) - parada 833']}
+    assert watcher.poll() == {}
+
+    # After the delay goes back above the lead time, crossing it again is notified.
+    assert watcher.poll() == {}
+    assert watcher.poll() == {'ana': ['2 llegará a las 12:04 (4 mins) - parada 833']}
+
+    # A line that disappears from the stop resets the state.
+    assert watcher.poll() == {}
+    assert watcher.poll() == {'ana': ['2 llegará a las 12:02 (2 mins) - parada 833']}
+
+
+def test_watcher_without_subscriptions(tmp_path, monkeypatch):
+    monkeypatch.setattr(warner, 'analyse_stops', None)
+
+    assert Watcher(str(tmp_path / 'missing.json')).poll() == {}
@@ -0,0 +1,51 @@
+import json
+
+from watchlist import DEFAULT_ENTRIES, Scheduler, WatchEntry, Watchlist, merge_entries
+
+
+def test_watch_entry():
+    entry = WatchEntry('833', (8, '2', 2), '30', 'CLINICO')
+
+    assert entry.stop_id == 833
+    assert entry.lines == ('2', '8')
+    assert entry.interval == 30
+    assert entry.key == '833:2,8'
+    assert WatchEntry(833, 2).lines == ('2',)
+    assert WatchEntry(833).key == '833:*'
+    assert WatchEntry(833, source='other').key == 'other/833:*'
+
+
+def test_merge_entries():
+    entries = [WatchEntry(833, 2), WatchEntry(686, 2), WatchEntry(833, (8, 2)),
+               WatchEntry(812), WatchEntry(812, 8), WatchEntry(833, 1, source='other')]
+
+    assert merge_entries(entries) == [(686, ('2',), 'auvasa'), (812, None, 'auvasa'),
+                                      (833, ('2', '8'), 'auvasa'), (833, ('1',), 'other')]
+    assert merge_entries([]) == []
+
+
+def test_watchlist(tmp_path):
+    path = tmp_path / 'watchlist.json'
+    watchlist = Watchlist(str(path))
+
+    assert watchlist.entries == DEFAULT_ENTRIES
+    assert set(watchlist.named()) == {'GAMAZO', 'CLINICO'}
+
+    path.write_text(json.dumps([{'stop_id': 833, 'lines': [2], 'name': 'CLINICO'},
+                                {'stop_id': 686, 'interval': 300}]))
+    assert watchlist.entries == (WatchEntry(833, 2, name='CLINICO'), WatchEntry(686, None, 300))
+    assert list(watchlist.named()) == ['CLINICO']
+
+
+def test_scheduler(tmp_path):
+    path = tmp_path / 'watchlist.json'
+    path.write_text(json.dumps([{'stop_id': 833, 'lines': [2]}, {'stop_id': 686, 'interval': 300}]))
+
+    scheduler = Scheduler(Watchlist(str(path)), str(tmp_path / 'schedule.json'), slack=5)
+    entries = scheduler.due(now=1000)
+    assert len(entries) == 2
+
+    scheduler.mark_polled(entries, now=1000)
+    assert scheduler.due(now=1030) == []
+    assert scheduler.due(now=1058) == [WatchEntry(833, 2)]
+    assert len(scheduler.due(now=1300)) == 2
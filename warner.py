@@ -1,49 +1,213 @@
 import argparse
+import json
 import logging
+import os
 import platform
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 
 from rpi.connections import Connections
 from rpi.custom_logging import configure_logging
 from rpi.managers.users_manager import UsersManager
 
-from busdatagenerator import analyse_stop
+from busdatagenerator import WATCHLIST, analyse_stop, analyse_stops
+from profiling import profile_from_env
 
-CHOICES = ('GAMAZO', 'CLINICO')
+MAX_AGE = 90
 
 if platform.system() == 'Linux':
     LINUX = True
-    configure_logging(filename='/home/pi/busstats/busstats.log')
+    SUBSCRIPTIONS_PATH = '/home/pi/busstats/subscriptions.json'
+    LOG_PATH = '/home/pi/busstats/busstats.log'
+    configure_logging(filename=LOG_PATH)
 
 else:
     LINUX = False
-    configure_logging(name='busstats', filename='D:/.scripts/busstats/busstats.log')
+    SUBSCRIPTIONS_PATH = 'D:/.scripts/busstats/subscriptions.json'
+    LOG_PATH = 'D:/.scripts/busstats/busstats.log'
+    configure_logging(name='busstats', filename=LOG_PATH)
 
 
-if __name__ == '__main__':
+@dataclass(frozen=True)
+class Subscription:
+    """Alert requested by a user: notify when the line will arrive at the stop in lead_time
+    minutes or less."""
+    user: str
+    stop_id: int
+    line: str
+    lead_time: int
+
+
+def load_subscriptions(path):
+    """Reads the subscriptions from a json file.
+
+    The file must contain a list of objects with the keys user, stop_id, line and lead_time.
+
+    Args:
+        path (str): path of the json file.
+
+    Returns:
+        Tuple[Subscription]
+    """
+    with open(path, 'r', encoding='utf-8') as fh:
+        data = json.load(fh)
+
+    return tuple(Subscription(str(x['user']), int(x['stop_id']), str(x['line']),
+                              int(x['lead_time'])) for x in data)
+
+
+def format_register(register):
+    """Returns the text line that describes the arrival of a register."""
+    register_datetime = datetime.strptime(register.actual_datetime, '%Y-%m-%d %H:%M:%S')
+    arrival_time = (register_datetime + timedelta(minutes=register.delay_minutes)).time()
+    return f'{register.line} llegará a las {arrival_time.strftime("%H:%M")} ' \
+        f'({register.delay_minutes} mins)'
+
+
+class Watcher:
+    """Evaluates every subscription against the data of each poll.
+
+    The stops are analysed concurrently, each one once per poll no matter how many subscriptions
+    it has, and a user is only notified when an arrival crosses the lead time of one of its
+    subscriptions.
+
+    Args:
+        path (str): path of the subscriptions file, reloaded when it changes.
+        interval (int | float): seconds between polls.
+    """
+
+    def __init__(self, path=SUBSCRIPTIONS_PATH, interval=60):
+        self.path = path
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+
+        self._mtime = None
+        self._subscriptions = ()
+        self._last_delays = {}
+
+    @property
+    def subscriptions(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return self._subscriptions
+
+        if mtime != self._mtime:
+            try:
+                self._subscriptions = load_subscriptions(self.path)
+                self._mtime = mtime
+                self.logger.debug('Loaded %d subscriptions', len(self._subscriptions))
+            except (ValueError, KeyError, TypeError):
+                self.logger.exception('Invalid subscriptions file %r:', self.path)
+
+        return self._subscriptions
+
+    def poll(self):
+        """Analyses the stops and returns the messages to send.
+
+        Returns:
+            Dict[str, List[str]]: lines of the message of each user.
+        """
+        subscriptions = self.subscriptions
+        stops = sorted({x.stop_id for x in subscriptions})
+        if not stops:
+            return {}
+
+        results = analyse_stops([(stop_id, None) for stop_id in stops], max_age=self.interval)
+
+        next_arrivals = {}
+        for stop_id, registers in zip(stops, results):
+            for register in registers:
+                key = (stop_id, register.line)
+                if key not in next_arrivals or \
+                        register.delay_minutes < next_arrivals[key].delay_minutes:
+                    next_arrivals[key] = register
+
+        messages = {}
+        for subscription in subscriptions:
+            register = next_arrivals.get((subscription.stop_id, subscription.line))
+            previous = self._last_delays.get(subscription)
+
+            if register is None:
+                self._last_delays.pop(subscription, None)
+                continue
+
+            self._last_delays[subscription] = register.delay_minutes
+            if register.delay_minutes > subscription.lead_time:
+                continue
+            if previous is not None and previous <= subscription.lead_time:
+                continue
+
+            messages.setdefault(subscription.user, []).append(
+                f'{format_register(register)} - parada {subscription.stop_id}')
+
+        return messages
+
+    def notify(self, messages):
+        for user, lines in messages.items():
+            self.logger.debug('Notifying %r (%d alerts)', user, len(lines))
+            Connections.notify('BusWarner', '\n'.join(lines), destinations=[user], force=True)
+
+    def run(self):
+        """Polls and notifies forever."""
+        while True:
+            t0 = time.time()
+            try:
+                self.notify(self.poll())
+            except Exception:
+                self.logger.exception('Error in watch loop:')
+
+            time.sleep(max(0.0, self.interval - (time.time() - t0)))
+
+
+def warn(choice, notify):
+    """Notifies the users once with the next arrivals of a named watchlist entry."""
+    entries = WATCHLIST.named()
+    if choice not in entries:
+        raise RuntimeError(f'Invalid option {choice!r}')
+
+    entry = entries[choice]
+    data = analyse_stop(stop_number=entry.stop_id, lines=entry.lines, max_age=MAX_AGE,
+                        source=entry.source)
+
+    message = '\n'.join([format_register(register) for register in data])
+    Connections.notify(f'BusWarner - {choice.capitalize()}', message, destinations=notify,
+                       force=True)
+
+
+def main():
     logger = logging.getLogger(__name__)
 
     parser = argparse.ArgumentParser('BusWarner')
-    parser.add_argument('choice', choices=CHOICES)
-    parser.add_argument('notify', nargs='+', choices=UsersManager().usernames)
+    parser.add_argument('choice', nargs='?', choices=sorted(WATCHLIST.named()))
+    parser.add_argument('notify', nargs='*')
+    parser.add_argument('-watch', action='store_true', help='keep running, notifying the '
+                                                            'subscriptions')
+    parser.add_argument('-subscriptions', default=SUBSCRIPTIONS_PATH)
+    parser.add_argument('-interval', type=int, default=60)
 
     opt = parser.parse_args()
     logger.debug('Options: %r', opt)
 
-    if opt.choice == 'GAMAZO':
-        data = analyse_stop(stop_number=686, lines=2)
-    elif opt.choice == 'CLINICO':
-        data = analyse_stop(stop_number=833, lines=(2, 8))
-    else:
-        raise RuntimeError(f'Invalid option {opt.choice!r}')
-
-    message = ''
-    for register in data:
-        register_datetieme = datetime.strptime(register.actual_datetime, '%Y-%m-%d %H:%M:%S')
-        arrival_time = (register_datetieme + timedelta(seconds=register.delay_minutes * 60)).time()
-        message += f'{register.line} llegará a las {arrival_time.strftime("%H:%M")} ' \
-            f'({register.delay_minutes} mins)\n'
-
-    message = message.strip()
-    Connections.notify(f'BusWarner - {opt.choice.capitalize()}', message, destinations=opt.notify,
-                       force=True)
+    if opt.watch is True:
+        try:
+            Watcher(opt.subscriptions, opt.interval).run()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if opt.choice is None or not opt.notify:
+        parser.error('choice and notify are required without -watch')
+
+    usernames = UsersManager().usernames
+    for username in opt.notify:
+        if username not in usernames:
+            parser.error(f'invalid user {username!r} (choose from {", ".join(usernames)})')
+
+    warn(opt.choice, opt.notify)
+
+
+if __name__ == '__main__':
+    with profile_from_env(os.path.dirname(LOG_PATH), 'warner'):
+        main()
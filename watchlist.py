@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""Declarative list of the bus stops and lines to watch, and the scheduler of their polls."""
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from atomic import atomic_write
+from sources import DEFAULT_SOURCE
+
+
+@dataclass(frozen=True)
+class WatchEntry:
+    """Bus stop (and lines) of a source to poll every interval seconds.
+
+    If lines is None, every line of the stop is registered.
+    """
+    stop_id: int
+    lines: Optional[Tuple[str, ...]] = None
+    interval: int = 60
+    name: Optional[str] = None
+    source: str = DEFAULT_SOURCE
+
+    def __post_init__(self):
+        object.__setattr__(self, 'stop_id', int(self.stop_id))
+        object.__setattr__(self, 'interval', int(self.interval))
+        if self.lines is not None:
+            if isinstance(self.lines, (str, int)):
+                lines = (str(self.lines),)
+            else:
+                lines = tuple(sorted({str(x) for x in self.lines}))
+            object.__setattr__(self, 'lines', lines)
+
+    @property
+    def key(self):
+        """Identifier of the entry in the scheduler state."""
+        key = f'{self.stop_id}:{",".join(self.lines) if self.lines else "*"}'
+        if self.source != DEFAULT_SOURCE:
+            key = f'{self.source}/{key}'
+        return key
+
+
+DEFAULT_ENTRIES = (
+    WatchEntry(686, (2,), name='GAMAZO'),
+    WatchEntry(682, (8,)),  # Fray luis de león
+    WatchEntry(812, (2, 8)),  # Fuente dorada
+    WatchEntry(833, (2, 8), name='CLINICO'),
+    WatchEntry(880, (2,)),  # Donde nos deja el 2 en ciencias
+    WatchEntry(1191, (8,)),  # Parada anterior a la del campus
+    WatchEntry(1358, (8,)),  # Campus miguel delibes
+)
+
+
+def merge_entries(entries):
+    """Merges the entries of the same stop, so each stop page is fetched only once.
+
+    Args:
+        entries (Iterable[WatchEntry]): entries to merge.
+
+    Returns:
+        List[Tuple[int, Tuple[str] | None, str]]: stop id, lines (None means every line) and
+            source of each stop, sorted by source and stop id.
+    """
+    stops = {}
+    for entry in entries:
+        key = (entry.source, entry.stop_id)
+        if entry.lines is None or stops.get(key, ()) is None:
+            stops[key] = None
+        else:
+            stops[key] = stops.get(key, ()) + entry.lines
+
+    return [(stop_id, None if lines is None else tuple(sorted(set(lines))), source)
+            for (source, stop_id), lines in sorted(stops.items())]
+
+
+class Watchlist:
+    """Watchlist read from a json file, reloaded when the file changes.
+
+    The file must contain a list of objects with the keys stop_id and, optionally, lines,
+    interval, name and source. If the file does not exist, the default entries are used.
+
+    Args:
+        path (str): path of the json file.
+        default (Iterable[WatchEntry]): entries used if the file does not exist.
+    """
+
+    def __init__(self, path, default=DEFAULT_ENTRIES):
+        self.path = path
+        self.default = tuple(default)
+        self.logger = logging.getLogger(__name__)
+
+        self._mtime = None
+        self._entries = self.default
+
+    @property
+    def entries(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            self._mtime = None
+            self._entries = self.default
+            return self._entries
+
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as fh:
+                    self._entries = tuple(WatchEntry(**x) for x in json.load(fh))
+                self._mtime = mtime
+                self.logger.debug('Loaded %d watchlist entries', len(self._entries))
+            except (ValueError, TypeError):
+                self.logger.exception('Invalid watchlist %r:', self.path)
+
+        return self._entries
+
+    def named(self):
+        """Returns the entries with name, as a dict (name -> entry)."""
+        return {x.name: x for x in self.entries if x.name}
+
+
+class Scheduler:
+    """Decides which watchlist entries must be polled, saving the last poll of each entry.
+
+    Args:
+        watchlist (Watchlist): watchlist to schedule.
+        state_path (str): json file where the time of the last poll of each entry is saved.
+        slack (int | float): seconds of tolerance, so entries polled by cron every interval
+            seconds are not skipped because of small delays.
+    """
+
+    def __init__(self, watchlist, state_path, slack=5):
+        self.watchlist = watchlist
+        self.state_path = state_path
+        self.slack = slack
+        self.logger = logging.getLogger(__name__)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.logger.warning('Corrupted scheduler state %r, ignoring it', self.state_path)
+            return {}
+
+    def due(self, now=None):
+        """Returns the entries whose interval has passed since their last poll."""
+        now = time.time() if now is None else now
+        state = self._load_state()
+
+        return [entry for entry in self.watchlist.entries
+                if now - state.get(entry.key, 0) + self.slack >= entry.interval]
+
+    def mark_polled(self, entries, now=None):
+        """Saves the time of the poll of the entries."""
+        now = time.time() if now is None else now
+        state = self._load_state()
+        state.update({entry.key: now for entry in entries})
+
+        with atomic_write(self.state_path) as fh:
+            json.dump(state, fh)